@@ -0,0 +1,70 @@
+"""Compare size against export and read time for each datapackage compression option.
+
+Run with ``python benchmarks/bench_compression.py [number of edges | datapackage.zip]``.
+The given datapackage, or a synthetic one, is imported into a database in a
+temporary Brightway project, which is then exported with
+``to_dardanelles_datapackage`` using each option; reading loads both tables
+with ``Datapackage``. Given datapackages can't have exchanges with other
+databases, as those aren't in the temporary project."""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Keep the benchmark database out of the user's Brightway directory; must be
+# set before `bw2data` is imported
+os.environ["BRIGHTWAY_DIR"] = tempfile.mkdtemp(prefix="dardanelles-benchmarks-")
+
+import bw2data as bd  # noqa: E402
+from synthetic import synthetic_datapackage  # noqa: E402
+
+from dardanelles.client.export_df import to_dardanelles_datapackage  # noqa: E402
+from dardanelles.client.import_class import DardanellesStreamingImporter  # noqa: E402
+from dardanelles.datapackage import COMPRESSION, Datapackage  # noqa: E402
+
+
+def read_package(filepath: Path) -> None:
+    dp = Datapackage(filepath, lazy=True)
+    dp.nodes, dp.edges
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    arg = sys.argv[1] if len(sys.argv) > 1 else "100000"
+    with tempfile.TemporaryDirectory() as td:
+        if arg.endswith(".zip"):
+            source = Path(arg)
+        else:
+            source = synthetic_datapackage(Path(td), int(arg))
+        bd.projects.set_current("compression-benchmark")
+        db = DardanellesStreamingImporter(
+            Datapackage(source, lazy=True)
+        ).write_database(searchable=False)
+        print(f"{db.name}: {len(db):,} nodes\n")
+
+        print(
+            f"{'compression':>12} {'size (MB)':>10} {'export (s)':>10} {'read (s)':>10}"
+        )
+        for name in COMPRESSION:
+            directory = Path(td) / name
+            directory.mkdir()
+            export_seconds, filepath = timed(
+                to_dardanelles_datapackage,
+                db.name,
+                author="benchmark",
+                description="Compression benchmark",
+                directory=directory,
+                compression=name,
+            )
+            read_seconds, _ = timed(read_package, filepath)
+            size = filepath.stat().st_size / 1e6
+            print(
+                f"{name:>12} {size:>10.2f} {export_seconds:>10.2f} {read_seconds:>10.2f}"
+            )
@@ -0,0 +1,59 @@
+"""Compare row-by-row and columnar conversion of datapackages to importer data.
+
+Run with ``python benchmarks/bench_conversion.py [number of edges]``."""
+
+import sys
+import time
+from numbers import Number
+
+import numpy as np
+from synthetic import synthetic_tables
+
+from dardanelles.client.convert import datapackage_to_data
+
+
+# Row-by-row conversion, as done by the client before ``convert``
+def reformat_edge(dct: dict, nodes: list):
+    stripper = lambda x: x.replace("source_", "") if x.startswith("source_") else x
+
+    try:
+        node = nodes[dct["source_id"]]
+        dct["input"] = (node["database"], node["code"])
+    except KeyError:
+        pass
+
+    target = dct.pop("target_id")
+    dct = {stripper(k): v for k, v in dct.items() if not k.startswith("target_")}
+    dct["amount"] = dct.pop("edge_amount")
+    dct["type"] = dct.pop("edge_type")
+    return target, dct
+
+
+def clean_dict(dct: dict):
+    notnan = lambda x: not isinstance(x, Number) or not np.isnan(x)
+    hasvalue = lambda x: bool(x) or x == 0
+    return {k: v for k, v in dct.items() if notnan(v) and hasvalue(v)}
+
+
+def rowwise(dp):
+    data = {obj["id"]: clean_dict(obj) for obj in dp.nodes.to_dict("records")}
+    for dct in data.values():
+        dct["exchanges"] = []
+    for row in dp.edges.to_dict("records"):
+        id_, exc = reformat_edge(row, data)
+        data[id_]["exchanges"].append(exc)
+    return {(obj["database"], obj["code"]): obj for obj in data.values()}
+
+
+def timed(func, dp):
+    start = time.perf_counter()
+    func(dp)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    num_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    dp = synthetic_tables(num_edges)
+    for label, func in (("row-by-row", rowwise), ("columnar", datapackage_to_data)):
+        seconds = timed(func, dp)
+        print(f"{label:>12}: {seconds:.2f} s, {num_edges / seconds:,.0f} edges/s")
@@ -0,0 +1,22 @@
+"""Reading and validating datapackages"""
+
+import pytest
+
+from dardanelles.datapackage import Datapackage
+
+
+def parse(filepath):
+    dp = Datapackage(filepath, lazy=True)
+    return dp.nodes, dp.edges
+
+
+@pytest.mark.benchmark(group="datapackage")
+def bench_parse(benchmark, package):
+    nodes, edges = benchmark(parse, package)
+    assert len(edges)
+
+
+@pytest.mark.benchmark(group="datapackage")
+def bench_validate(benchmark, package):
+    counts = benchmark(lambda: Datapackage(package, lazy=True).validate())
+    assert counts["edges.csv"]
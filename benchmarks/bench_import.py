@@ -0,0 +1,24 @@
+"""Converting datapackages to data for ``bw2io`` importers"""
+
+import pytest
+
+from dardanelles.client.convert import datapackage_to_data
+from dardanelles.datapackage import Datapackage
+
+
+@pytest.mark.benchmark(group="import")
+def bench_datapackage_to_data(benchmark, package):
+    data = benchmark(lambda: datapackage_to_data(Datapackage(package, lazy=True)))
+    assert data
+
+
+@pytest.mark.benchmark(group="import")
+def bench_streaming_importer(benchmark, package):
+    pytest.importorskip("bw2io")
+    from dardanelles.client.import_class import DardanellesStreamingImporter
+
+    def convert():
+        dp = Datapackage(package, lazy=True)
+        return sum(len(batch) for batch in DardanellesStreamingImporter(dp).batches())
+
+    assert benchmark(convert)
@@ -0,0 +1,98 @@
+"""Upload, catalog, index page and download endpoints, through the Flask test client"""
+
+import hashlib
+
+import pytest
+
+
+def sha256(filepath):
+    with open(filepath, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def remove_package(hash):
+    from dardanelles.server.db import File, FileIndex
+    from dardanelles.server.store import remove_blob
+
+    for obj in File.select().where(File.sha256 == hash):
+        FileIndex.delete().where(FileIndex.rowid == obj.id).execute()
+        obj.delete_instance()
+    remove_blob(hash)
+
+
+def upload(client, filepath, hash):
+    with open(filepath, "rb") as f:
+        response = client.post(
+            "/upload",
+            data={
+                "sha256": hash,
+                "database": "synthetic",
+                "filename": filepath.name,
+                "api_key": "benchmark",
+                "file": (f, filepath.name),
+            },
+            content_type="multipart/form-data",
+        )
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response
+
+
+@pytest.fixture
+def stored_package(client, package):
+    """Hash of ``package``, uploaded to the server"""
+    from dardanelles.server.db import File
+
+    hash = sha256(package)
+    if not File.select().where(File.sha256 == hash).exists():
+        upload(client, package, hash)
+    return hash
+
+
+@pytest.mark.benchmark(group="upload")
+def bench_upload(benchmark, client, package):
+    """Receive, hash, validate and store a new package"""
+    hash = sha256(package)
+    benchmark.pedantic(
+        upload,
+        args=(client, package, hash),
+        setup=lambda: remove_package(hash),
+        rounds=5,
+    )
+
+
+@pytest.mark.benchmark(group="download")
+def bench_download(benchmark, client, stored_package):
+    def download():
+        response = client.get(f"/download/{stored_package}")
+        body = response.get_data()
+        response.close()
+        return body
+
+    assert benchmark(download)
+
+
+@pytest.mark.benchmark(group="catalog")
+def bench_catalog_cold(benchmark, client, catalog):
+    from dardanelles.server.cache import catalog_cache
+
+    response = benchmark.pedantic(
+        client.get, args=("/catalog",), setup=catalog_cache.invalidate, rounds=20
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="catalog")
+def bench_catalog_warm(benchmark, client, catalog):
+    client.get("/catalog")
+    response = benchmark(client.get, "/catalog")
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="catalog")
+def bench_index_cold(benchmark, client, catalog):
+    from dardanelles.server.cache import index_cache
+
+    response = benchmark.pedantic(
+        client.get, args=("/?page=2",), setup=index_cache.invalidate, rounds=20
+    )
+    assert response.status_code == 200
@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+# The server creates its data directory on import, so point it at a temporary
+# directory before anything imports `dardanelles.server`
+_root = tempfile.mkdtemp(prefix="dardanelles-benchmarks-")
+for _name in ("XDG_DATA_HOME", "XDG_CACHE_HOME", "XDG_STATE_HOME"):
+    os.environ[_name] = os.path.join(_root, _name.lower())
+os.makedirs(os.environ["XDG_DATA_HOME"])
+
+import pytest  # noqa: E402
+from synthetic import synthetic_catalog, synthetic_datapackage  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--edges",
+        default="10000,100000",
+        help="Comma-separated numbers of edges in synthetic datapackages",
+    )
+    parser.addoption(
+        "--catalog-size",
+        type=int,
+        default=10_000,
+        help="Number of `File` rows in the synthetic server catalog",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "num_edges" in metafunc.fixturenames:
+        sizes = [int(x) for x in metafunc.config.getoption("edges").split(",")]
+        metafunc.parametrize("num_edges", sizes, scope="session")
+
+
+@pytest.fixture(scope="session")
+def packages_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("packages")
+
+
+@pytest.fixture(scope="session")
+def package(packages_dir, num_edges):
+    """Synthetic CSV datapackage with ``num_edges`` edges"""
+    return synthetic_datapackage(packages_dir, num_edges)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from dardanelles.server import dardanelles_app
+    from dardanelles.server.db import User
+
+    User.create(name="benchmark", api_key="benchmark", email_hash="benchmark")
+    return dardanelles_app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope="session")
+def catalog(app, request):
+    """Server catalog with ``--catalog-size`` synthetic ``File`` rows"""
+    synthetic_catalog(request.config.getoption("catalog_size"))
@@ -0,0 +1,167 @@
+"""Synthetic datapackages and server catalogs of configurable size, for benchmarks."""
+
+import datetime
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from bw_processing.io_helpers import file_writer, generic_zipfile_filesystem
+
+from dardanelles.client.export_df import write_csv, write_parquet
+from dardanelles.datapackage import PARQUET_MIMETYPE, compression_options
+
+
+def synthetic_tables(num_edges: int, edges_per_node: int = 10, seed: int = 42):
+    """Nodes and edges tables shaped like those of an exported database.
+
+    Each node has ``edges_per_node`` edges, with random sources in the same
+    database; about half of the edges have lognormal uncertainty."""
+    num_nodes = max(num_edges // edges_per_node, 1)
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, num_nodes + 1)
+    nodes = pd.DataFrame(
+        {
+            "categories": np.nan,
+            "code": [f"code-{i}" for i in ids],
+            "database": "synthetic",
+            "id": ids,
+            "location": "GLO",
+            "name": [f"activity {i}" for i in ids],
+            "reference product": [f"product {i}" for i in ids],
+            "type": "process",
+            "unit": "kilogram",
+        }
+    )
+    targets = np.repeat(ids, edges_per_node)[:num_edges]
+    sources = rng.integers(1, num_nodes + 1, size=len(targets))
+    edges = pd.DataFrame(
+        {
+            "target_id": targets,
+            "target_database": "synthetic",
+            "target_code": [f"code-{i}" for i in targets],
+            "source_id": sources,
+            "source_database": "synthetic",
+            "source_code": [f"code-{i}" for i in sources],
+            "source_name": [f"activity {i}" for i in sources],
+            "source_location": "GLO",
+            "source_unit": "kilogram",
+            "source_categories": np.nan,
+            "edge_amount": rng.random(len(targets)),
+            "edge_type": "technosphere",
+            "uncertainty_type": np.where(rng.random(len(targets)) > 0.5, 2, np.nan),
+            "loc": rng.random(len(targets)),
+            "scale": np.nan,
+        }
+    )
+    return SimpleNamespace(nodes=nodes, edges=edges)
+
+
+def write_datapackage(
+    dirpath: Path,
+    filename: str,
+    nodes: pd.DataFrame,
+    edges: pd.DataFrame,
+    database: str = "synthetic",
+    table_format: str = "csv",
+    compression: str = "deflate",
+) -> Path:
+    """Write ``nodes`` and ``edges`` to a datapackage, as ``to_dardanelles_datapackage`` does"""
+    fs = generic_zipfile_filesystem(
+        dirpath=Path(dirpath),
+        filename=filename,
+        write=True,
+        **compression_options(compression),
+    )
+    metadata = {
+        "profile": "tabular-data-package",
+        "name": database,
+        "database": database,
+        "description": f"Synthetic database with {len(edges)} edges",
+        "depends": [],
+        "licenses": [],
+        "resources": [],
+    }
+    for name, df in (("nodes", nodes), ("edges", edges)):
+        path = f"{name}.{table_format}"
+        metadata["resources"].append(
+            {
+                "path": path,
+                "profile": "tabular-data-resource",
+                "mediatype": "text/csv" if table_format == "csv" else PARQUET_MIMETYPE,
+                "schema": {"fields": [{"name": label} for label in df.columns]},
+            }
+        )
+        if table_format == "csv":
+            write_csv(fs, path, df, chunk_size=50_000, pipeline=True)
+        else:
+            string_columns = [
+                label for label, dtype in df.dtypes.items() if dtype == object
+            ]
+            write_parquet(fs, path, df, string_columns)
+    file_writer(
+        data=metadata, fs=fs, resource="datapackage.json", mimetype="application/json"
+    )
+    fs.close()
+    return Path(dirpath) / filename
+
+
+def synthetic_datapackage(
+    dirpath: Path,
+    num_edges: int,
+    table_format: str = "csv",
+    compression: str = "deflate",
+) -> Path:
+    tables = synthetic_tables(num_edges)
+    return write_datapackage(
+        dirpath,
+        f"synthetic-{num_edges}.zip",
+        tables.nodes,
+        tables.edges,
+        table_format=table_format,
+        compression=compression,
+    )
+
+
+def synthetic_catalog(num_files: int, num_users: int = 10, num_databases: int = 100):
+    """Add ``num_files`` rows to the server ``File`` table, with dependencies.
+
+    Only database rows are created; there are no files in the store. Needs
+    the server data directory to be set up, so import ``dardanelles.server``
+    first."""
+    from peewee import chunked
+
+    from dardanelles.server.db import Dependency, File, User, sql_database
+
+    users = [
+        User.get_or_create(
+            name=f"user-{i}",
+            defaults={"api_key": f"key-{i}", "email_hash": f"email-{i}"},
+        )[0]
+        for i in range(num_users)
+    ]
+    start = File.select().count()
+    created = datetime.datetime(2020, 1, 1)
+    rows = [
+        {
+            "user": users[i % num_users],
+            "filepath": f"synthetic-{i}.zip",
+            "filename": f"synthetic-{i}.zip",
+            "sha256": hashlib.sha256(f"synthetic-{i}".encode()).hexdigest(),
+            "database": f"database {i % num_databases}",
+            "description": f"Synthetic package {i}",
+            "depends": [f"database {(i + 1) % num_databases}"],
+            "created": created + datetime.timedelta(minutes=i),
+            "accessed": created,
+        }
+        for i in range(start, start + num_files)
+    ]
+    with sql_database.atomic():
+        for batch in chunked(rows, 500):
+            File.insert_many(batch).execute()
+        query = File.select(File.id, File.depends).where(File.id > start)
+        for batch in chunked(query, 500):
+            Dependency.insert_many(
+                [{"file": obj.id, "database": obj.depends[0]} for obj in batch]
+            ).on_conflict_ignore().execute()
@@ -0,0 +1,96 @@
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import appdirs
+import requests
+
+from .errors import HashMismatch
+from .utils import download_with_progressbar, sha256
+
+cache_dir = Path(appdirs.user_cache_dir("dardanelles", "dd"))
+
+
+class DownloadCache:
+    """Persistent local cache of datapackages, stored as ``<sha256>.zip``.
+
+    Files are checked against their hash when added. Reading a file marks it
+    as recently used; once the cache is larger than ``max_size`` bytes, the
+    least recently used files are deleted."""
+
+    def __init__(
+        self,
+        dirpath: Optional[Union[str, Path]] = None,
+        max_size: int = 2 * 1024 * 1024 * 1024,
+    ):
+        self.dirpath = Path(dirpath or cache_dir / "packages")
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def path(self, file_hash: str) -> Path:
+        return self.dirpath / f"{file_hash}.zip"
+
+    def full_path(self, file_hash: str) -> Path:
+        """Path of the full datapackage made by applying delta ``file_hash``"""
+        return self.dirpath / f"{file_hash}.full.zip"
+
+    def partial_path(self, file_hash: str) -> Path:
+        return self.dirpath / f"{file_hash}.zip.partial"
+
+    def __contains__(self, file_hash: str) -> bool:
+        return self.path(file_hash).exists()
+
+    def get(self, file_hash: str) -> Optional[Path]:
+        """Return path of cached file, or ``None`` if not in cache"""
+        filepath = self.path(file_hash)
+        try:
+            # Modification time tracks use, as access times are often disabled
+            os.utime(filepath)
+        except FileNotFoundError:
+            return None
+        return filepath
+
+    def add(self, filepath: Union[str, Path], file_hash: str) -> Path:
+        """Move ``filepath`` into the cache after checking its hash"""
+        if sha256(filepath) != file_hash:
+            Path(filepath).unlink()
+            raise HashMismatch(f"Contents of {filepath} don't match hash {file_hash}")
+        target = self.path(file_hash)
+        os.replace(filepath, target)
+        os.utime(target)
+        self.evict(keep=file_hash)
+        return target
+
+    def fetch(
+        self, url: str, file_hash: str, session: Optional[requests.Session] = None
+    ) -> Path:
+        """Download ``url`` into the cache, resuming a previous partial download"""
+        filepath = download_with_progressbar(
+            url=url,
+            filename=self.partial_path(file_hash).name,
+            dirpath=self.dirpath,
+            session=session,
+        )
+        return self.add(filepath, file_hash)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        files = []
+        for fp in self.dirpath.glob("*.zip"):
+            try:
+                stat = fp.stat()
+            except FileNotFoundError:
+                # Removed by another thread or process
+                continue
+            files.append((stat.st_mtime, stat.st_size, fp))
+        total = sum(size for _, size, _ in files)
+        for _, size, fp in sorted(files, key=lambda x: x[0]):
+            if total <= self.max_size:
+                break
+            if fp.name == f"{keep}.zip":
+                continue
+            fp.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        for fp in self.dirpath.glob("*.zip*"):
+            fp.unlink()
@@ -1,25 +1,28 @@
+import os
+import shutil
+import tarfile
 import tempfile
-from numbers import Number
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 import bcrypt
-import numpy as np
 import requests
 import wrapt
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..datapackage import Datapackage
+from ..delta import apply_delta, create_delta, is_delta
+from .cache import DownloadCache
+from .convert import datapackage_to_data
 from .errors import AlreadyExists, RemoteError
 from .export_df import to_dardanelles_datapackage
-from .import_class import DardanellesImporter
+from .import_class import DardanellesImporter, DardanellesStreamingImporter
 from .utils import sha256
 
-try:
-    from bw2io.download_utils import download_with_progressbar
-except ImportError:
-    from .utils import download_with_progressbar
-
-
 DEFAULT_SALT = b"$2b$12$1FBcxtAiJUHWbTxY/47O1u"
 
 
@@ -27,7 +30,11 @@ DEFAULT_SALT = b"$2b$12$1FBcxtAiJUHWbTxY/47O1u"
 def check_alive(wrapped, instance, args, kwargs):
     if not instance.alive:
         raise RemoteError("Can't reach {}".format(instance.url))
-    return wrapped(*args, **kwargs)
+    try:
+        return wrapped(*args, **kwargs)
+    except requests.ConnectionError:
+        instance.mark_unhealthy()
+        raise RemoteError("Can't reach {}".format(instance.url))
 
 
 def register(
@@ -47,42 +54,150 @@ def register(
         raise RemoteError
 
 
-def reformat_edge(dct: dict, nodes: list):
-    stripper = lambda x: x.replace("source_", "") if x.startswith("source_") else x
-
-    try:
-        node = nodes[dct["source_id"]]
-        dct["input"] = (node["database"], node["code"])
-    except KeyError:
-        pass
-
-    target = dct.pop("target_id")
-    dct = {stripper(k): v for k, v in dct.items() if not k.startswith("target_")}
-    dct["amount"] = dct.pop("edge_amount")
-    dct["type"] = dct.pop("edge_type")
-    return target, dct
+class DardanellesClient:
+    """Client for a dardanelles server.
 
+    Requests share one ``requests.Session``, so connections are kept alive
+    and reused. Idempotent requests are retried ``retries`` times with
+    exponential backoff on connection errors and ``502``/``503``/``504``
+    responses.
 
-def clean_dict(dct: dict):
-    notnan = lambda x: not isinstance(x, Number) or not np.isnan(x)
-    hasvalue = lambda x: bool(x) or x == 0
-    return {k: v for k, v in dct.items() if notnan(v) and hasvalue(v)}
+    The server is pinged before an operation only if no response has been
+    received from it in the last ``alive_ttl`` seconds; a failed connection
+    or server error marks the server as unhealthy."""
 
+    # Files larger than this are uploaded in chunks, which can be resumed
+    chunked_upload_threshold = 32 * 1024 * 1024
+    # Seconds to wait for the server to validate and store an upload
+    upload_timeout = 60 * 60
+    # Number of catalog responses, by filters and page, kept for revalidation
+    catalog_cache_size = 8
 
-class DardanellesClient:
-    def __init__(self, api_key: str, url: str = "https://lci.brightway.dev"):
+    def __init__(
+        self,
+        api_key: str,
+        url: str = "https://lci.brightway.dev",
+        cache: Optional[DownloadCache] = None,
+        max_workers: int = 4,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        alive_ttl: float = 60,
+    ):
         self.url = url
         self.api_key = api_key
+        self.cache = cache or DownloadCache()
+        self.max_workers = max_workers
+        self.alive_ttl = alive_ttl
+        self._alive_until = 0
+        # Reuse connections, with enough of them for `max_workers` threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=max_workers,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.hooks["response"].append(self._track_health)
         while self.url.endswith("/"):
             self.url = self.url[:-1]
+        self._catalog_cache = OrderedDict()
+
+    def _track_health(self, response, *args, **kwargs):
+        if response.status_code < 500:
+            self._alive_until = time.monotonic() + self.alive_ttl
+        else:
+            self.mark_unhealthy()
+
+    def mark_unhealthy(self):
+        self._alive_until = 0
 
     @property
     def alive(self):
-        return requests.get(self.url + "/ping").status_code == 200
+        if time.monotonic() < self._alive_until:
+            return True
+        try:
+            return self.session.get(self.url + "/ping").status_code == 200
+        except requests.ConnectionError:
+            self.mark_unhealthy()
+            return False
 
     @check_alive
-    def catalog(self):
-        return requests.get(self.url + "/catalog").json()
+    def catalog(
+        self,
+        database: Optional[str] = None,
+        user: Optional[str] = None,
+        depends: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ):
+        """Get list of ``(filename, database, sha256)`` for packages on the server.
+
+        Results can be filtered by ``database`` name, uploader ``user`` name, or
+        the name of a database the package ``depends`` on. The last
+        ``catalog_cache_size`` responses are cached locally and only downloaded
+        again if the server catalog has changed."""
+        params = {
+            key: value
+            for key, value in (
+                ("database", database),
+                ("user", user),
+                ("depends", depends),
+                ("limit", limit),
+                ("offset", offset),
+            )
+            if value is not None
+        }
+        key = tuple(sorted(params.items()))
+        headers = {}
+        if key in self._catalog_cache:
+            headers["If-None-Match"] = self._catalog_cache[key][0]
+
+        resp = self.session.get(self.url + "/catalog", params=params, headers=headers)
+        if resp.status_code == 304:
+            self._catalog_cache.move_to_end(key)
+            return self._catalog_cache[key][1]
+        elif resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+
+        data = resp.json()
+        if "ETag" in resp.headers:
+            self._catalog_cache[key] = (resp.headers["ETag"], data)
+            self._catalog_cache.move_to_end(key)
+            while len(self._catalog_cache) > self.catalog_cache_size:
+                self._catalog_cache.popitem(last=False)
+        return data
+
+    def iter_catalog(self, page_size: int = 500, **filters):
+        """Iterate over the catalog, fetching ``page_size`` rows at a time.
+
+        Takes the same filters as ``catalog``."""
+        offset = 0
+        while True:
+            page = self.catalog(limit=page_size, offset=offset, **filters)
+            yield from page
+            if len(page) < page_size:
+                break
+            offset += page_size
+
+    def search(self, q: str, limit: int = 20, offset: int = 0) -> list:
+        """Search package names, descriptions, licenses and node names, locations
+        and categories on the server.
+
+        ``q`` uses the SQLite FTS5 query syntax, e.g. ``market electricity``,
+        ``"market for steel"`` or ``name:transport``. Returns a list of
+        dictionaries with ``filename``, ``database``, ``sha256`` and
+        ``description``, best match first."""
+        resp = self.session.get(
+            self.url + "/search", params={"q": q, "limit": limit, "offset": offset}
+        )
+        if resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+        return resp.json()
 
     @check_alive
     def upload_database(
@@ -94,7 +209,12 @@ class DardanellesClient:
         version: Optional[str] = None,
         id_: Optional[str] = None,
         licenses: Optional[list] = None,
+        base: Optional[str] = None,
     ):
+        """Export ``database`` and upload it.
+
+        If ``base`` is the hash of an earlier upload of this database, only
+        the changes since that version are uploaded, as a delta package."""
         with tempfile.TemporaryDirectory() as td:
             filepath = to_dardanelles_datapackage(
                 database=database,
@@ -106,42 +226,313 @@ class DardanellesClient:
                 id_=id_,
                 licenses=licenses,
             )
+            if base is not None:
+                filepath = create_delta(
+                    base=Datapackage(self.get_full_package(base), lazy=True),
+                    new=Datapackage(filepath, lazy=True),
+                    base_hash=base,
+                    dirpath=td,
+                )
             self._upload(filepath, database)
 
-    def _upload(self, filepath: str, database: str):
-        file_hash = sha256(filepath)
+    def _upload(
+        self,
+        filepath: str,
+        database: str,
+        wait: bool = True,
+        poll_interval: float = 1,
+        timeout: Optional[float] = None,
+    ):
+        """Upload the datapackage at ``filepath``.
+
+        Files larger than ``chunked_upload_threshold`` are sent in chunks; see
+        ``_upload_in_chunks``. The server validates the package in the
+        background. With ``wait``, poll until it is stored and return the
+        result; otherwise return a ``concurrent.futures.Future`` for the
+        result. Waiting gives up after ``timeout`` seconds (default
+        ``upload_timeout``)."""
+        filepath = Path(filepath)
         url = self.url + "/upload"
         data = {
             "api_key": self.api_key,
             "filename": filepath.name,
             "database": database,
             "sha256": sha256(filepath),
+            "async": "1",
         }
-        files = {"file": open(filepath, "rb")}
-        resp = requests.post(url, data=data, files=files)
+        resp = None
+        if filepath.stat().st_size > self.chunked_upload_threshold:
+            resp = self._upload_in_chunks(filepath, data)
+        if resp is None:
+            with open(filepath, "rb") as f:
+                resp = self.session.post(url, data=data, files={"file": f})
+        if resp.status_code == 202:
+            job = resp.json()["job"]
+            if timeout is None:
+                timeout = self.upload_timeout
+            if wait:
+                return self.wait_for_upload(job, poll_interval, timeout)
+            executor = ThreadPoolExecutor(max_workers=1)
+            future = executor.submit(self.wait_for_upload, job, poll_interval, timeout)
+            executor.shutdown(wait=False)
+            return future
+
+        # Servers without background processing store the package immediately
         if resp.status_code == 200:
-            return resp.json()
+            result = resp.json()
         else:
             raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+        if wait:
+            return result
+        future = Future()
+        future.set_result(result)
+        return future
 
-    def importer_from_hash(self, file_hash: str):
-        with tempfile.TemporaryDirectory() as td:
-            fp = download_with_progressbar(
-                url=self.url + "/download/" + file_hash, dirpath=td
+    def _upload_in_chunks(self, filepath: Path, data: dict):
+        """Send ``filepath`` in chunks of the size chosen by the server, using
+        ``max_workers`` parallel requests.
+
+        Failed chunks are retried like other requests. If an upload of the
+        same file was interrupted, only the chunks the server doesn't have
+        yet are sent. Returns the response to the final request, or ``None``
+        if the server doesn't support chunked uploads."""
+        resp = self.session.post(
+            self.url + "/upload/session",
+            data={**data, "size": filepath.stat().st_size},
+        )
+        if resp.status_code in (404, 405):
+            return None
+        elif resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+        session = resp.json()
+
+        url = "{}/upload/session/{}".format(self.url, session["session"])
+        chunk_size = session["chunk_size"]
+        count = max(-(-session["size"] // chunk_size), 1)
+
+        def send(index):
+            with open(filepath, "rb") as f:
+                f.seek(index * chunk_size)
+                chunk = f.read(chunk_size)
+            resp = self.session.put(
+                "{}/{}".format(url, index),
+                params={"api_key": self.api_key},
+                data=chunk,
+                headers={"Content-Type": "application/octet-stream"},
             )
-            dp = Datapackage(fp)
-            data = {
-                obj["id"]: clean_dict(obj)
-                for obj in dp.nodes.to_dict("records")
-            }
-            for dct in data.values():
-                dct["exchanges"] = []
-
-            for row in dp.edges.to_dict("records"):
-                id_, exc = reformat_edge(row, data)
-                data[id_]["exchanges"].append(exc)
-
-            return DardanellesImporter(
-                data={(obj["database"], obj["code"]): obj for obj in data.values()},
-                metadata=dp.metadata,
+            if resp.status_code != 200:
+                raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+
+        missing = sorted(set(range(count)).difference(session["received"]))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(send, missing))
+
+        return self.session.post(
+            url + "/finish", data={"api_key": self.api_key, "async": data["async"]}
+        )
+
+    def wait_for_upload(
+        self, job: str, poll_interval: float = 1, timeout: Optional[float] = None
+    ) -> dict:
+        """Poll the status of upload ``job`` until it finishes.
+
+        Returns ``{"filename", "sha256"}`` if the package was stored, and raises
+        ``RemoteError`` if it was rejected, or if it hasn't finished after
+        ``timeout`` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            resp = self.session.get(self.url + "/upload/" + job)
+            if resp.status_code != 200:
+                raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+            status = resp.json()
+            if status["status"] == "done":
+                return status["result"]
+            elif status["status"] == "failed":
+                raise RemoteError("{}: {}".format(status["code"], status["message"]))
+            elif deadline is not None and time.monotonic() >= deadline:
+                raise RemoteError(
+                    "Upload job {} not finished after {} seconds".format(job, timeout)
+                )
+            time.sleep(poll_interval)
+
+    @check_alive
+    def upload_many(
+        self,
+        filepaths: Iterable,
+        batch_size: int = 10,
+        batch_bytes: int = 64 * 1024 * 1024,
+    ) -> list:
+        """Upload several datapackages, in parallel batches of up to ``batch_size``
+        files and ``batch_bytes`` total size.
+
+        Returns a list of results, one per file, each with a ``status`` code."""
+        batches, batch, total = [], [], 0
+        for filepath in map(Path, filepaths):
+            size = filepath.stat().st_size
+            if batch and (len(batch) == batch_size or total + size > batch_bytes):
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append(filepath)
+            total += size
+        if batch:
+            batches.append(batch)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [
+                result
+                for results in executor.map(self._upload_batch, batches)
+                for result in results
+            ]
+
+    def _upload_batch(self, filepaths: list) -> list:
+        data = {
+            "api_key": self.api_key,
+            "sha256": [sha256(fp) for fp in filepaths],
+            "database": [Datapackage(fp, lazy=True).database for fp in filepaths],
+            "filename": [fp.name for fp in filepaths],
+        }
+        files = [("file", (fp.name, open(fp, "rb"))) for fp in filepaths]
+        try:
+            resp = self.session.post(self.url + "/upload/batch", data=data, files=files)
+        finally:
+            for _, (_, f) in files:
+                f.close()
+        if resp.status_code == 200:
+            return resp.json()
+        else:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+
+    def get_package(self, file_hash: str) -> Path:
+        """Get path to datapackage with hash ``file_hash``, downloading it if it
+        isn't already in the local cache."""
+        filepath = self.cache.get(file_hash)
+        if filepath is None:
+            filepath = self.cache.fetch(
+                self.url + "/download/" + file_hash, file_hash, session=self.session
             )
+        return filepath
+
+    def get_full_package(self, file_hash: str) -> Path:
+        """Like ``get_package``, but if ``file_hash`` is a delta, apply it to its
+        base package (downloaded if needed) and return the path to the result.
+
+        Full packages made from deltas are kept in the local cache."""
+        filepath = self.get_package(file_hash)
+        dp = Datapackage(filepath, lazy=True)
+        if not is_delta(dp):
+            return filepath
+
+        target = self.cache.full_path(file_hash)
+        if target.exists():
+            os.utime(target)
+            return target
+        base = Datapackage(self.get_full_package(dp.metadata["base"]), lazy=True)
+        tmp = apply_delta(
+            base, dp, self.cache.dirpath, filename=f"{file_hash}.full.zip.partial"
+        )
+        os.replace(tmp, target)
+        self.cache.evict(keep=file_hash)
+        return target
+
+    @check_alive
+    def download_many(self, hashes: Iterable[str], batch_size: int = 10) -> dict:
+        """Get paths to many datapackages, downloading the ones not already in the
+        local cache in parallel batches of ``batch_size``.
+
+        Returns a dictionary of hashes to file paths."""
+        paths = {file_hash: self.cache.get(file_hash) for file_hash in hashes}
+        missing = [file_hash for file_hash, fp in paths.items() if fp is None]
+        batches = [
+            missing[i : i + batch_size] for i in range(0, len(missing), batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for result in executor.map(self._download_batch, batches):
+                paths.update(result)
+        return paths
+
+    def _download_batch(self, hashes: list) -> dict:
+        resp = self.session.post(
+            self.url + "/download/batch", data={"sha256": hashes}, stream=True
+        )
+        if resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+
+        result = {}
+        resp.raw.decode_content = True
+        with tarfile.open(fileobj=resp.raw, mode="r|") as archive:
+            for member in archive:
+                file_hash = member.name[: -len(".zip")]
+                if file_hash not in hashes:
+                    continue
+                filepath = self.cache.partial_path(file_hash)
+                with open(filepath, "wb") as f:
+                    shutil.copyfileobj(archive.extractfile(member), f)
+                result[file_hash] = self.cache.add(filepath, file_hash)
+        return result
+
+    @check_alive
+    def dependencies(self, file_hash: str) -> dict:
+        """Resolve the databases the package ``file_hash`` depends on, directly or
+        indirectly, to packages on the server.
+
+        Returns ``{"packages": [(filename, database, sha256)], "missing": [names]}``,
+        with packages in import order (dependencies first). ``missing`` lists
+        databases which aren't available on the server."""
+        resp = self.session.get(self.url + "/depends/" + file_hash)
+        if resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+        return resp.json()
+
+    def summary(self, file_hash: str) -> dict:
+        """Summary of the package ``file_hash``, without downloading it.
+
+        Includes the package metadata, the number of ``nodes`` and ``edges``,
+        the ``source_databases`` referenced by edges, and the ``resources``
+        with their row counts and schema fields."""
+        resp = self.session.get(self.url + "/package/{}/summary".format(file_hash))
+        if resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+        return resp.json()
+
+    def nodes(self, file_hash: str, limit: int = 1000, offset: int = 0) -> list:
+        """List nodes of the package ``file_hash``, without downloading it.
+
+        Each node is a dictionary with its ``id``, ``database``, ``code``,
+        ``name``, ``reference product``, ``location``, ``unit``, ``type`` and
+        ``categories``, where given."""
+        resp = self.session.get(
+            self.url + "/package/{}/nodes".format(file_hash),
+            params={"limit": limit, "offset": offset},
+        )
+        if resp.status_code != 200:
+            raise RemoteError("{}: {}".format(resp.status_code, resp.text))
+        return resp.json()
+
+    def importer_from_hash(
+        self,
+        file_hash: str,
+        with_dependencies: bool = False,
+        streaming: bool = False,
+    ):
+        """Create an importer for the package ``file_hash``.
+
+        With ``with_dependencies``, returns a list of importers for this package
+        and all packages it depends on, in the order they should be imported.
+        Packages not in the local cache are downloaded in parallel.
+
+        With ``streaming``, returns ``DardanellesStreamingImporter`` instances,
+        which write to the database in batches instead of loading the whole
+        package into memory first."""
+        if with_dependencies:
+            hashes = [sha for _, _, sha in self.dependencies(file_hash)["packages"]]
+            self.download_many(hashes)
+            return [
+                self._importer(self.get_full_package(sha), streaming) for sha in hashes
+            ]
+        return self._importer(self.get_full_package(file_hash), streaming)
+
+    def _importer(self, filepath: Path, streaming: bool = False):
+        if streaming:
+            return DardanellesStreamingImporter(Datapackage(filepath, lazy=True))
+        dp = Datapackage(filepath)
+        return DardanellesImporter(data=datapackage_to_data(dp), metadata=dp.metadata)
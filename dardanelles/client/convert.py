@@ -0,0 +1,85 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from ..datapackage import Datapackage
+
+
+def keep_mask(df: pd.DataFrame) -> np.ndarray:
+    """Boolean array with the shape of ``df``; ``False`` for missing values.
+
+    Equivalent to the row-by-row ``clean_dict`` in ``benchmarks``: ``NaN``,
+    ``None`` and empty strings are missing, zero and ``False`` are not."""
+    mask = df.notna().to_numpy()
+    for i, (label, dtype) in enumerate(df.dtypes.items()):
+        if not pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(
+            dtype
+        ):
+            mask[:, i] &= (df[label] != "").to_numpy()
+    return mask
+
+
+def to_records(df: pd.DataFrame, mask: np.ndarray) -> list:
+    """Build a dictionary for each row of ``df``, skipping values where ``mask`` is ``False``"""
+    columns = list(df.columns)
+    values = zip(*(df[label].tolist() for label in columns))
+    return [
+        {label: value for label, value, keep in zip(columns, row, row_mask) if keep}
+        for row, row_mask in zip(values, mask)
+    ]
+
+
+def nodes_to_records(nodes: pd.DataFrame) -> list:
+    return to_records(nodes, keep_mask(nodes))
+
+
+def input_lookup(nodes: pd.DataFrame) -> pd.Series:
+    """Series of ``(database, code)`` keys, indexed by node ``id``"""
+    known = nodes[nodes["database"].notna() & nodes["code"].notna()]
+    return pd.Series(
+        list(zip(known["database"], known["code"])), index=known["id"], dtype=object
+    )
+
+
+def edges_to_records(
+    edges: pd.DataFrame, nodes: pd.DataFrame, lookup: Optional[pd.Series] = None
+) -> list:
+    """Convert edges to exchange dictionaries, in the same order as ``edges``.
+
+    ``target_*`` columns are dropped, ``source_*`` columns lose their prefix,
+    and ``input`` is set to ``(database, code)`` when ``source_id`` is one of
+    ``nodes``. Pass ``lookup`` from ``input_lookup`` to reuse it between calls."""
+    if edges.empty:
+        # Databases without exchanges, like biosphere databases
+        return []
+    if lookup is None:
+        lookup = input_lookup(nodes)
+
+    df = edges.drop(columns=[c for c in edges.columns if c.startswith("target_")])
+    df = df.rename(
+        columns={
+            **{c: c[len("source_") :] for c in df.columns if c.startswith("source_")},
+            "edge_amount": "amount",
+            "edge_type": "type",
+        }
+    )
+    if "source_id" in edges:
+        df["input"] = edges["source_id"].map(lookup)
+    return to_records(df, keep_mask(df))
+
+
+def datapackage_to_data(dp: Datapackage) -> dict:
+    """Convert datapackage to ``{(database, code): node}`` with ``exchanges`` for each node"""
+    nodes = nodes_to_records(dp.nodes)
+    exchanges = edges_to_records(dp.edges, dp.nodes)
+
+    position = {node["id"]: i for i, node in enumerate(nodes)}
+    for node in nodes:
+        node["exchanges"] = []
+    if exchanges:
+        groups = dp.edges.groupby("target_id", sort=False).indices
+        for target_id, rows in groups.items():
+            nodes[position[target_id]]["exchanges"] = [exchanges[i] for i in rows]
+
+    return {(node["database"], node["code"]): node for node in nodes}
@@ -8,3 +8,9 @@ class AlreadyExists(BaseException):
     """Resource has already been calculated"""
 
     pass
+
+
+class HashMismatch(BaseException):
+    """File contents don't match the expected SHA 256 hash"""
+
+    pass
@@ -1,15 +1,174 @@
 import datetime
+import io
+import queue
+import threading
 import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 import numpy as np
+import pandas as pd
 from bw2data import Database, databases
 from bw_processing.constants import DEFAULT_LICENSES
 from bw_processing.filesystem import clean_datapackage_name, safe_filename
 from bw_processing.io_helpers import file_writer, generic_zipfile_filesystem
 from bw_processing.utils import check_name, check_suffix
 
+from ..datapackage import (
+    NUMPY_MIMETYPE,
+    PARQUET_MIMETYPE,
+    compression_options,
+    pq,
+)
+
+UNCERTAINTY_FIELDS = (
+    "uncertainty_type",
+    "loc",
+    "scale",
+    "shape",
+    "minimum",
+    "maximum",
+    "negative",
+)
+
+# Columns of ``edges_to_dataframe``, for databases without exchanges
+EDGE_COLUMNS = {
+    "target_id": np.int64,
+    "target_database": object,
+    "target_code": object,
+    "target_name": object,
+    "target_reference_product": object,
+    "target_location": object,
+    "target_unit": object,
+    "target_type": object,
+    "source_id": np.int64,
+    "source_database": object,
+    "source_code": object,
+    "source_name": object,
+    "source_product": object,
+    "source_location": object,
+    "source_unit": object,
+    "source_categories": object,
+    "edge_amount": np.float64,
+    "edge_type": object,
+}
+
+NUMERIC_EDGE_DTYPE = [
+    ("target_id", np.int64),
+    ("source_id", np.int64),
+    ("amount", np.float64),
+]
+NUMERIC_UNCERTAINTY_DTYPE = [
+    ("uncertainty_type", np.int64),
+    ("loc", np.float64),
+    ("scale", np.float64),
+    ("shape", np.float64),
+    ("minimum", np.float64),
+    ("maximum", np.float64),
+    ("negative", np.bool_),
+]
+
+
+def numeric_edges_array(df: pd.DataFrame, add_uncertainty: bool) -> np.ndarray:
+    """Structured array of the numeric columns of the edges DataFrame ``df``"""
+    dtype = NUMERIC_EDGE_DTYPE + (NUMERIC_UNCERTAINTY_DTYPE if add_uncertainty else [])
+    array = np.zeros(len(df), dtype=dtype)
+    array["target_id"] = df["target_id"]
+    array["source_id"] = df["source_id"]
+    array["amount"] = df["edge_amount"]
+    if add_uncertainty:
+        # Missing uncertainty type is 0 (undefined) and missing `negative` is False
+        array["uncertainty_type"] = pd.to_numeric(df["uncertainty_type"]).fillna(0)
+        for label in ("loc", "scale", "shape", "minimum", "maximum"):
+            array[label] = pd.to_numeric(df[label])
+        array["negative"] = df["negative"].fillna(False).astype(bool)
+    return array
+
+
+def write_stored_array(fs, resource: str, array: np.ndarray):
+    """Write ``array`` in ``.npy`` format to an uncompressed zip member, so it
+    can be memory mapped when read"""
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    info = zipfile.ZipInfo(resource, date_time=datetime.datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    fs.zip.writestr(info, buffer.getbuffer())
+
+
+def prefetch(iterable, size: int = 2) -> Iterator:
+    """Produce items of ``iterable`` in a background thread, up to ``size`` ahead.
+
+    Closing the generator, e.g. when the consumer raises, stops the thread and
+    drops the items it already produced."""
+    buffer = queue.Queue(maxsize=size)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Don't block forever if the consumer is gone
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as exc:
+            put(exc)
+            return
+        put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            elif isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while not buffer.empty():
+            buffer.get_nowait()
+
+
+def write_csv(fs, resource: str, df: pd.DataFrame, chunk_size: int, pipeline: bool):
+    """Write ``df`` as CSV to ``resource`` in ``chunk_size`` row chunks.
+
+    With ``pipeline``, the next chunk is formatted while the current one is
+    compressed and written."""
+    chunks = (
+        df.iloc[i : i + chunk_size].to_csv(index=False, header=(i == 0)).encode("utf-8")
+        for i in range(0, max(len(df), 1), chunk_size)
+    )
+    if pipeline:
+        chunks = prefetch(chunks)
+    with fs.open(resource, mode="wb") as f, closing(chunks):
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def write_parquet(fs, resource: str, df: pd.DataFrame, string_columns: list):
+    """Write ``df`` as Parquet to ``resource``.
+
+    Values in ``string_columns`` are stored as strings, as they would be in
+    CSV, so that e.g. tuples don't become Parquet lists."""
+    df = df.copy()
+    for label in string_columns:
+        df[label] = df[label].where(df[label].isna(), df[label].astype(str))
+    with fs.open(resource, mode="wb") as f:
+        df.to_parquet(f, index=False)
+
 
 def to_dardanelles_datapackage(
     database: str,
@@ -20,12 +179,22 @@ def to_dardanelles_datapackage(
     version: Optional[str] = None,
     id_: Optional[str] = None,
     licenses: Optional[list] = None,
+    parallel: bool = True,
+    chunk_size: int = 50_000,
+    table_format: str = "csv",
+    numeric_edges: bool = False,
+    compression: str = "deflate",
 ):
     """Export a Brightway database to a zipped datapackage in a temporary directory.
 
     * ``database``: str. Name of database to export.
     * ``add_uncertainty``: bool, default ``True``. Add uncertainty columns to edges.
     * ``metadata``: dict for author, license, version
+    * ``parallel``: bool, default ``True``. Build the nodes and edges tables concurrently, and format CSV chunks while the previous chunk is compressed.
+    * ``chunk_size``: int. Number of rows written to the zipfile at a time.
+    * ``table_format``: str, default ``"csv"``. Use ``"parquet"`` to store nodes and edges as Parquet, which is smaller and faster to load. Requires ``pyarrow``.
+    * ``numeric_edges``: bool, default ``False``. Also store the numeric edge columns as an uncompressed structured array in ``edges.npy``, which can be memory mapped with ``Datapackage.edges_array``.
+    * ``compression``: str, default ``"deflate"``. Zip compression of the datapackage: ``"stored"`` (none; fastest to write and read), ``"deflate-fast"``, ``"deflate"``, ``"deflate-max"``, ``"bzip2"`` or ``"lzma"`` (smallest and slowest), or, on Python 3.14 or later, ``"zstd"`` or ``"zstd-max"``. ``edges.npy`` is always stored uncompressed. See ``benchmarks/bench_compression.py``.
 
     """
     if database not in databases:
@@ -36,22 +205,13 @@ def to_dardanelles_datapackage(
     if not len(db):
         raise ValueError(f"The given database {database} is empty")
 
-    dirpath = Path(directory or Path.cwd())
-
-    def add_uncertainty_columns(node, edge, row):
-        fields = (
-            "uncertainty_type",
-            "loc",
-            "scale",
-            "shape",
-            "minimum",
-            "maximum",
-            "negative",
-        )
-        for field in fields:
-            row[field] = edge.get(field)
+    if table_format not in ("csv", "parquet"):
+        raise ValueError(f"Unknown table format {table_format}")
+    elif table_format == "parquet" and pq is None:
+        raise ImportError("Parquet export requires `pyarrow`")
+    zip_options = compression_options(compression)
 
-    formatters = [add_uncertainty_columns] if add_uncertainty else []
+    dirpath = Path(directory or Path.cwd())
 
     name = clean_datapackage_name(database)
     check_name(name)
@@ -82,7 +242,6 @@ def to_dardanelles_datapackage(
         (str, "string"),
         (np.bool_, "boolean"),
         (bool, "boolean"),
-        (np.float_, "number"),
         (np.float32, "number"),
         (np.float64, "number"),
     ]
@@ -91,47 +250,85 @@ def to_dardanelles_datapackage(
         for x, y in mapping:
             if x == dtype:
                 return y
+        if pd.api.types.is_string_dtype(dtype):
+            return "string"
         raise ValueError(f"Can't understand dtype {dtype}")
 
     filename = check_suffix(safe_filename(database), "zip")
-    zipfile = generic_zipfile_filesystem(dirpath=dirpath, filename=filename, write=True)
-
-    df = db.nodes_to_dataframe()
-    resource = {
-        "path": "nodes.csv",
-        "profile": "tabular-data-resource",
-        "mediatype": "text/csv",
-        "schema": {
-            "primaryKey": "id",
-            "fields": [
-                {
-                    "name": label,
-                    "type": get_dtype(dtype),
-                }
-                for label, dtype in zip(df.columns, df.dtypes)
-            ],
-        },
-    }
-    metadata["resources"].append(resource)
-    file_writer(data=df, fs=zipfile, resource="nodes.csv", mimetype="text/csv")
-
-    df = db.edges_to_dataframe(categorical=False, formatters=formatters)
-    resource = {
-        "path": "edges.csv",
-        "profile": "tabular-data-resource",
-        "mediatype": "text/csv",
-        "schema": {
-            "fields": [
-                {
-                    "name": label,
-                    "type": get_dtype(dtype),
-                }
-                for label, dtype in zip(df.columns, df.dtypes)
-            ]
-        },
-    }
-    metadata["resources"].append(resource)
-    file_writer(data=df, fs=zipfile, resource="edges.csv", mimetype="text/csv")
+    zipfile = generic_zipfile_filesystem(
+        dirpath=dirpath, filename=filename, write=True, **zip_options
+    )
+
+    def nodes_dataframe():
+        return db.nodes_to_dataframe()
+
+    def edges_dataframe():
+        # Collect edges as they are visited, and build uncertainty columns in
+        # one step instead of setting each value in a per-edge formatter
+        edges = []
+        formatters = [lambda node, edge, row: edges.append(edge)]
+        df = db.edges_to_dataframe(
+            categorical=False, formatters=formatters if add_uncertainty else None
+        )
+        if df.empty:
+            # No exchanges gives a DataFrame without columns
+            df = pd.DataFrame(
+                {label: pd.Series(dtype=dtype) for label, dtype in EDGE_COLUMNS.items()}
+            )
+        if add_uncertainty:
+            uncertainty = pd.DataFrame.from_records(edges, columns=UNCERTAINTY_FIELDS)
+            df = pd.concat([df, uncertainty.set_index(df.index)], axis=1)
+        return df
+
+    def add_table(name, df, schema):
+        fields = [
+            {
+                "name": label,
+                "type": get_dtype(dtype),
+            }
+            for label, dtype in zip(df.columns, df.dtypes)
+        ]
+        path = f"{name}.{table_format}"
+        metadata["resources"].append(
+            {
+                "path": path,
+                "profile": "tabular-data-resource",
+                "mediatype": "text/csv" if table_format == "csv" else PARQUET_MIMETYPE,
+                "schema": {**schema, "fields": fields},
+            }
+        )
+        if table_format == "csv":
+            write_csv(zipfile, path, df, chunk_size, parallel)
+        else:
+            string_columns = [f["name"] for f in fields if f["type"] == "string"]
+            write_parquet(zipfile, path, df, string_columns)
+
+    with ThreadPoolExecutor(max_workers=2 if parallel else 1) as executor:
+        nodes_future = executor.submit(nodes_dataframe)
+        edges_future = executor.submit(edges_dataframe)
+
+        # Nodes are written while edges are still being built
+        add_table("nodes", nodes_future.result(), {"primaryKey": "id"})
+        edges = edges_future.result()
+        add_table("edges", edges, {})
+
+    if numeric_edges:
+        array = numeric_edges_array(edges, add_uncertainty)
+        metadata["resources"].append(
+            {
+                "path": "edges.npy",
+                "profile": "data-resource",
+                "format": "npy",
+                "mediatype": NUMPY_MIMETYPE,
+                "schema": {
+                    "fields": [
+                        {"name": name, "type": np.dtype(dtype).name}
+                        for name, dtype in array.dtype.descr
+                    ]
+                },
+            }
+        )
+        write_stored_array(zipfile, "edges.npy", array)
 
     file_writer(
         data=metadata,
@@ -1,6 +1,14 @@
+from itertools import groupby, islice
+from typing import Iterator, Optional
+
+from bw2data import Database, databases, geomapping
+from bw2data.backends import ActivityDataset, ExchangeDataset, sqlite3_lci_db
 from bw2io.importers.base_lci import LCIImporter
 from bw2io.strategies import tupleize_categories
 
+from ..datapackage import Datapackage
+from .convert import edges_to_records, input_lookup, nodes_to_records
+
 
 class DardanellesImporter(LCIImporter):
     def __init__(self, data, metadata):
@@ -8,3 +16,147 @@ class DardanellesImporter(LCIImporter):
         self.strategies = [tupleize_categories] + self.strategies
         self.data = data
         self.metadata = metadata
+
+
+class DardanellesStreamingImporter:
+    """Import a datapackage into ``bw2data`` in bounded memory.
+
+    Edges are read ``chunk_size`` rows at a time, and each node is finished
+    as soon as all of its edges have been read, so edges must be grouped by
+    ``target_id``, as they are in exported datapackages. Finished nodes are
+    processed with the same strategies as ``DardanellesImporter`` and written
+    to the database ``batch_size`` at a time. Only the nodes table is held in
+    memory in full."""
+
+    def __init__(
+        self, dp: Datapackage, chunk_size: int = 100_000, batch_size: int = 1_000
+    ):
+        self.dp = dp
+        self.metadata = dp.metadata
+        self.db_name = dp.database
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.strategies = [tupleize_categories] + LCIImporter(self.db_name).strategies
+
+    def __iter__(self) -> Iterator[dict]:
+        """Generate each node with its ``exchanges``"""
+        nodes = self.dp.nodes
+        lookup = input_lookup(nodes)
+        pending = {node["id"]: node for node in nodes_to_records(nodes)}
+        current = None
+
+        edges_index = self.dp.resources.index(self.dp.edges_resource)
+        fields = {field["name"] for field in self.dp.edges_resource["schema"]["fields"]}
+        # Databases without exchanges can have only the uncertainty columns
+        chunks = (
+            self.dp.chunks(edges_index, self.chunk_size)
+            if {"target_id", "source_id"} <= fields
+            else ()
+        )
+        for chunk in chunks:
+            exchanges = edges_to_records(chunk, nodes, lookup)
+            for target, group in groupby(
+                zip(chunk["target_id"].tolist(), exchanges), key=lambda x: x[0]
+            ):
+                # Edges of one node can continue into the next chunk
+                if current is None or current["id"] != target:
+                    if current is not None:
+                        yield current
+                    if target not in pending:
+                        raise ValueError(
+                            f"Edges of node {target} aren't grouped together, "
+                            "or it isn't in the nodes table"
+                        )
+                    current = pending.pop(target)
+                    current["exchanges"] = []
+                current["exchanges"].extend(exc for _, exc in group)
+        if current is not None:
+            yield current
+
+        # Nodes without edges
+        for node in pending.values():
+            node["exchanges"] = []
+            yield node
+
+    def batches(self) -> Iterator[list]:
+        """Generate lists of up to ``batch_size`` nodes, after applying strategies"""
+        iterator = iter(self)
+        while True:
+            batch = list(islice(iterator, self.batch_size))
+            if not batch:
+                return
+            for strategy in self.strategies:
+                batch = strategy(batch)
+            yield batch
+
+    def _external_input(self, exc: dict, codes: dict) -> tuple:
+        """Link an exchange from another database by its source ``database``
+        and ``code``; ``codes`` caches the codes of each linked database"""
+        key = (exc.get("database"), exc.get("code"))
+        if key[0] not in codes:
+            if key[0] not in databases:
+                raise ValueError(
+                    f"Exchange input {key} is in a database which isn't in this "
+                    "project; import its dependencies first"
+                )
+            codes[key[0]] = {
+                code
+                for (code,) in ActivityDataset.select(ActivityDataset.code)
+                .where(ActivityDataset.database == key[0])
+                .tuples()
+            }
+        if key[1] not in codes[key[0]]:
+            raise ValueError(f"Exchange input {key} doesn't exist in this project")
+        return key
+
+    def write_database(
+        self,
+        db_name: Optional[str] = None,
+        searchable: bool = True,
+        check_typos: bool = False,
+    ) -> Database:
+        """Write all nodes to ``db_name`` (default is the package database name),
+        replacing any existing data"""
+        db_name = db_name or self.db_name
+        db = Database(db_name)
+        if db_name not in databases:
+            db.register(write_empty=False, format="dardanelles")
+
+        count, locations, codes = 0, set(), {}
+        db._drop_indices()
+        try:
+            with sqlite3_lci_db.db.atomic():
+                db.delete(keep_params=True, warn=False, vacuum=False, signal=False)
+                for batch in self.batches():
+                    exchanges, activities = [], []
+                    for ds in batch:
+                        ds["database"] = db_name
+                        for exc in ds["exchanges"]:
+                            if "input" not in exc:
+                                exc["input"] = self._external_input(exc, codes)
+                            elif exc["input"][0] == self.db_name:
+                                exc["input"] = (db_name, exc["input"][1])
+                        exchanges, activities = db._efficient_write_dataset(
+                            ds, exchanges, activities, check_typos
+                        )
+                        if ds.get("location"):
+                            locations.add(ds["location"])
+                    # Rows not yet inserted by `_efficient_write_dataset`
+                    if activities:
+                        ActivityDataset.insert_many(activities).execute()
+                    if exchanges:
+                        ExchangeDataset.insert_many(exchanges).execute()
+                    count += len(batch)
+        except:
+            db.delete(warn=False, signal=False)
+            raise
+        finally:
+            db._add_indices()
+
+        databases[db_name]["number"] = count
+        databases.set_modified(db_name)
+        geomapping.add(locations)
+        if searchable:
+            db.make_searchable(reset=True, signal=False)
+        db.process()
+        return db
@@ -7,7 +7,7 @@ import requests
 from tqdm import tqdm
 
 
-def get_filename(response: requests.Response):
+def get_filename(response: requests.Response, url: str):
     if "Content-Disposition" in response.headers.keys():
         filename = re.findall("filename=(.+)", response.headers["Content-Disposition"])[
             0
@@ -28,28 +28,45 @@ def download_with_progressbar(
     filename: Optional[str] = None,
     dirpath: Optional[str] = None,
     chunk_size: Optional[int] = 4096 * 8,
+    resume: bool = True,
+    session: Optional[requests.Session] = None,
 ):
-    response = requests.get(url, stream=True)
-    if response.status_code != 200:
+    """Download ``url`` to ``dirpath``, showing a progress bar.
+
+    If ``filename`` is given and a partial file with that name already
+    exists, only the missing bytes are requested with a ``Range`` header."""
+    filepath, headers, offset = None, {}, 0
+    if filename:
+        filepath = (Path(dirpath) / filename) if dirpath else (Path.cwd() / filename)
+        if resume and filepath.exists() and filepath.stat().st_size:
+            offset = filepath.stat().st_size
+            headers["Range"] = f"bytes={offset}-"
+
+    response = (session or requests).get(url, stream=True, headers=headers)
+    if response.status_code == 416 and offset:
+        # Requested range starts at the end of the file; already complete
+        return filepath
+    if response.status_code not in (200, 206):
         raise ValueError(f"URL {url} returns status code {response.status_code}")
+    if response.status_code == 200:
+        offset = 0
 
     if not filename:
-        filename = get_filename(response)
+        filename = get_filename(response, url)
+        filepath = (Path(dirpath) / filename) if dirpath else (Path.cwd() / filename)
 
     total_length = response.headers.get("content-length")
 
-    filepath = (Path(dirpath) / filename) if dirpath else (Path.cwd() / filename)
-
-    with open(filepath, "wb") as f:
+    with open(filepath, "ab" if offset else "wb") as f:
         print(f"Downloading {filename} to {filepath}")
         if not total_length:
             f.write(response.content)
         else:
-            total_length = int(total_length)
-            with tqdm(total=total_length) as pbar:
+            total_length = int(total_length) + offset
+            with tqdm(total=total_length, initial=offset) as pbar:
                 for data in response.iter_content(chunk_size=chunk_size):
                     f.write(data)
-                    pbar.update(chunk_size)
+                    pbar.update(len(data))
 
     return filepath
 
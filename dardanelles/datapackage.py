@@ -1,15 +1,87 @@
-from mimetypes import guess_type
+import csv
+import io
+import struct
+import zipfile
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Optional, Union
 
+import numpy as np
+import pandas as pd
 from bw_processing.errors import InvalidMimetype
 from bw_processing.io_helpers import file_reader, generic_zipfile_filesystem
 
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+NUMPY_MIMETYPE = "application/octet-stream"
+# Tabular resource formats, by file suffix
+TABULAR_MIMETYPES = {".csv": "text/csv", ".parquet": PARQUET_MIMETYPE}
+RESOURCE_MIMETYPES = {**TABULAR_MIMETYPES, ".npy": NUMPY_MIMETYPE}
+
+# Zip compression options for exported datapackages, as arguments to
+# `generic_zipfile_filesystem`. Zstandard needs Python 3.14 or later.
+ZIP_ZSTANDARD = getattr(zipfile, "ZIP_ZSTANDARD", None)
+COMPRESSION = {
+    "stored": {"compression": zipfile.ZIP_STORED},
+    "deflate-fast": {"compression": zipfile.ZIP_DEFLATED, "compresslevel": 1},
+    "deflate": {"compression": zipfile.ZIP_DEFLATED},
+    "deflate-max": {"compression": zipfile.ZIP_DEFLATED, "compresslevel": 9},
+    "bzip2": {"compression": zipfile.ZIP_BZIP2},
+    "lzma": {"compression": zipfile.ZIP_LZMA},
+}
+if ZIP_ZSTANDARD is not None:
+    COMPRESSION["zstd"] = {"compression": ZIP_ZSTANDARD}
+    COMPRESSION["zstd-max"] = {"compression": ZIP_ZSTANDARD, "compresslevel": 19}
+# Compression methods this Python can read
+READABLE_COMPRESSION = {options["compression"] for options in COMPRESSION.values()}
+
+
+def compression_options(name: str) -> dict:
+    if name in COMPRESSION:
+        return COMPRESSION[name]
+    elif name.startswith("zstd"):
+        raise ValueError("Zstandard compression requires Python 3.14 or later")
+    raise ValueError(
+        f"Unknown compression `{name}`; use one of {', '.join(COMPRESSION)}"
+    )
+
+
+def resource_mimetype(path: str) -> str:
+    mimetype = RESOURCE_MIMETYPES.get(Path(path).suffix)
+    if mimetype is None:
+        raise InvalidMimetype(f"Resource `{path}` isn't CSV, Parquet or Numpy")
+    return mimetype
+
+
+def read_array_header(f) -> tuple:
+    """Read ``(shape, fortran_order, dtype)`` from the start of a ``.npy`` file"""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
 
 class Datapackage:
-    def __init__(self, filepath: Union[str, Path]):
+    """Dardanelles datapackage with ``nodes`` and ``edges`` resources.
+
+    Resources are stored as CSV (``nodes.csv``, ``edges.csv``) or, if
+    ``pyarrow`` is installed, Parquet (``nodes.parquet``, ``edges.parquet``).
+    Packages can also include the numeric edge columns as a structured
+    array in ``edges.npy``; see ``edges_array``. Any zip compression in
+    ``COMPRESSION`` can be read.
+
+    With ``lazy=True`` only ``datapackage.json`` is read when the object is
+    created; resources are loaded into DataFrames the first time ``nodes``,
+    ``edges`` or ``data`` is accessed. Use ``validate`` to check resources
+    without loading them."""
+
+    def __init__(self, filepath: Union[str, Path], lazy: bool = False):
         fp = Path(filepath)
         assert fp.exists()
+        self.filepath = fp
         self.fs = generic_zipfile_filesystem(
             dirpath=fp.parent, filename=fp.name, write=False
         )
@@ -17,34 +89,192 @@ class Datapackage:
             fs=self.fs, resource="datapackage.json", mimetype="application/json"
         )
         self.resources = self.metadata["resources"]
-        self.data = []
-        for resource in self.resources:
-            try:
-                self.data.append(
-                    file_reader(
-                        fs=self.fs,
-                        resource=resource["path"],
-                        mimetype=resource["mediatype"],
-                    )
-                )
-            except (InvalidMimetype, KeyError):
-                raise InvalidMimetype
+        self._data = {}
+        if not lazy:
+            self.data
 
         self.depends = self.metadata["depends"]
         self.database = self.metadata["database"]
         self.name = self.metadata["name"]
         self.description = self.metadata["description"]
 
-        index = [
-            i for i, dct in enumerate(self.resources) if dct["path"] == "nodes.csv"
-        ]
-        if not len(index) == 1:
-            raise ValueError("Datapackage is missing `nodes.csv`")
-        self.nodes = self.data[index[0]]
+        self._nodes_index = self._resource_index("nodes")
+        self._edges_index = self._resource_index("edges")
+        self.nodes_resource = self.resources[self._nodes_index]
+        self.edges_resource = self.resources[self._edges_index]
 
+    def _resource_index(self, name: str) -> int:
         index = [
-            i for i, dct in enumerate(self.resources) if dct["path"] == "edges.csv"
+            i
+            for i, dct in enumerate(self.resources)
+            if dct["path"] in {name + suffix for suffix in TABULAR_MIMETYPES}
         ]
         if not len(index) == 1:
-            raise ValueError("Datapackage is missing `edges.csv`")
-        self.edges = self.data[index[0]]
+            raise ValueError(f"Datapackage is missing `{name}.csv`")
+        return index[0]
+
+    def load(self, index: int):
+        """Load resource number ``index``, caching the result"""
+        if index not in self._data:
+            resource = self.resources[index]
+            if resource.get("mediatype") == PARQUET_MIMETYPE:
+                self._data[index] = self._read_parquet(resource)
+            else:
+                try:
+                    self._data[index] = file_reader(
+                        fs=self.fs,
+                        resource=resource["path"],
+                        mimetype=resource["mediatype"],
+                    )
+                except (InvalidMimetype, KeyError):
+                    raise InvalidMimetype
+        return self._data[index]
+
+    def columns(self, index: int, columns: list) -> pd.DataFrame:
+        """Load only ``columns`` of tabular resource number ``index``.
+
+        Uses the cached DataFrame if the whole resource was already loaded."""
+        if index in self._data:
+            return self._data[index][columns]
+        resource = self.resources[index]
+        if resource.get("mediatype") == PARQUET_MIMETYPE and pq is None:
+            raise ImportError("Reading Parquet resources requires `pyarrow`")
+        with self.fs.open(resource["path"], "rb") as f:
+            if resource.get("mediatype") == PARQUET_MIMETYPE:
+                df = pd.read_parquet(f, columns=columns)
+            else:
+                df = pd.read_csv(f, usecols=columns)
+        return df[columns]
+
+    def chunks(
+        self, index: int, chunk_size: int, columns: Optional[list] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Read tabular resource number ``index`` as DataFrames of at most
+        ``chunk_size`` rows, without loading the whole resource.
+
+        If given, only ``columns`` are read."""
+        resource = self.resources[index]
+        if resource.get("mediatype") == PARQUET_MIMETYPE and pq is None:
+            raise ImportError("Reading Parquet resources requires `pyarrow`")
+        with self.fs.open(resource["path"], "rb") as f:
+            if resource.get("mediatype") == PARQUET_MIMETYPE:
+                batches = pq.ParquetFile(f).iter_batches(
+                    batch_size=chunk_size, columns=columns
+                )
+                for batch in batches:
+                    yield batch.to_pandas()
+            else:
+                for chunk in pd.read_csv(f, chunksize=chunk_size, usecols=columns):
+                    yield chunk if columns is None else chunk[columns]
+
+    @property
+    def data(self) -> list:
+        return [self.load(index) for index in range(len(self.resources))]
+
+    @property
+    def nodes(self):
+        return self.load(self._nodes_index)
+
+    @property
+    def edges(self):
+        return self.load(self._edges_index)
+
+    @property
+    def edges_array(self) -> Optional[np.ndarray]:
+        """Numeric edge data from ``edges.npy``, or ``None`` if not present"""
+        if not any(dct["path"] == "edges.npy" for dct in self.resources):
+            return None
+        return self.array("edges.npy")
+
+    def array(self, path: str, mmap: bool = True) -> np.ndarray:
+        """Load the Numpy array resource ``path``.
+
+        If the zip member is stored without compression, and ``mmap`` is
+        ``True``, the array is a read-only ``numpy.memmap`` directly over the
+        zip file, so no data is copied into memory and processes opening the
+        same package share the operating system page cache."""
+        info = self.fs.zip.getinfo(path)
+        if not mmap or info.compress_type != zipfile.ZIP_STORED:
+            with self.fs.open(path, "rb") as f:
+                return np.load(f, allow_pickle=False)
+
+        with open(self.filepath, "rb") as f:
+            # Data starts after the 30 byte local file header, the file name,
+            # and the extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            shape, fortran_order, dtype = read_array_header(f)
+            offset = f.tell()
+        return np.memmap(
+            self.filepath,
+            dtype=dtype,
+            mode="r",
+            offset=offset,
+            shape=shape,
+            order="F" if fortran_order else "C",
+        )
+
+    def validate(self) -> dict:
+        """Check that each resource exists and that tabular resources have the
+        columns declared in their schema, without loading them into memory.
+
+        Returns a dictionary of resource paths to number of data rows. Raises
+        ``InvalidMimetype`` or ``ValueError`` if a resource isn't valid, or is
+        compressed with a method this Python can't read."""
+        for info in self.fs.zip.infolist():
+            if info.compress_type not in READABLE_COMPRESSION:
+                raise ValueError(
+                    f"`{info.filename}` uses unsupported compression method "
+                    f"{info.compress_type}"
+                )
+        counts = {}
+        for resource in self.resources:
+            mimetype = resource_mimetype(resource["path"])
+            if resource.get("mediatype") != mimetype:
+                raise InvalidMimetype
+            elif mimetype == NUMPY_MIMETYPE:
+                counts[resource["path"]] = self._count_array_rows(resource)
+            elif mimetype == PARQUET_MIMETYPE:
+                counts[resource["path"]] = self._count_parquet_rows(resource)
+            else:
+                counts[resource["path"]] = self._count_csv_rows(resource)
+        return counts
+
+    def _count_csv_rows(self, resource: dict) -> int:
+        expected = [field["name"] for field in resource["schema"]["fields"]]
+        with self.fs.open(resource["path"], "rb") as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))
+            try:
+                header = next(reader)
+            except StopIteration:
+                raise ValueError(f"Resource `{resource['path']}` is empty")
+            if header != expected:
+                raise ValueError(
+                    f"Columns in `{resource['path']}` don't match its schema"
+                )
+            return sum(1 for _ in reader)
+
+    def _read_parquet(self, resource: dict) -> pd.DataFrame:
+        if pq is None:
+            raise ImportError("Reading Parquet resources requires `pyarrow`")
+        with self.fs.open(resource["path"], "rb") as f:
+            return pd.read_parquet(f)
+
+    def _count_parquet_rows(self, resource: dict) -> int:
+        if pq is None:
+            raise ImportError("Reading Parquet resources requires `pyarrow`")
+        expected = [field["name"] for field in resource["schema"]["fields"]]
+        with self.fs.open(resource["path"], "rb") as f:
+            # Row count and column names come from the file footer
+            parquet = pq.ParquetFile(f)
+            if parquet.schema_arrow.names != expected:
+                raise ValueError(
+                    f"Columns in `{resource['path']}` don't match its schema"
+                )
+            return parquet.metadata.num_rows
+
+    def _count_array_rows(self, resource: dict) -> int:
+        with self.fs.open(resource["path"], "rb") as f:
+            shape, _, _ = read_array_header(f)
+            return shape[0]
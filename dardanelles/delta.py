@@ -0,0 +1,250 @@
+"""Delta datapackages, which store the changes between two versions of a database.
+
+A delta has the same ``nodes`` and ``edges`` resources as a full datapackage,
+and its ``datapackage.json`` has ``"profile": "dardanelles-delta"``, the
+``base`` sha256 hash of the package it applies to, and ``removed``, the keys
+of base nodes and edges which were deleted.
+
+``bw2data`` assigns new ids whenever a database is written, so changes are
+keyed by ``NODE_KEY`` and ``EDGE_KEY`` instead, and id columns are ignored
+when comparing rows. Nodes which were added or changed are included in
+``nodes``. Edges with the same key (e.g. two inputs from the same provider)
+are compared as a group, and groups which were added or changed are
+included in ``edges``. Applying the delta replaces these nodes and edge
+groups in the base package, drops removed ones, and then sets the id
+columns so that edges refer to the ids of the nodes in the result."""
+
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import pandas as pd
+from bw_processing.io_helpers import file_writer, generic_zipfile_filesystem
+
+from .datapackage import Datapackage
+
+DELTA_PROFILE = "dardanelles-delta"
+NODE_KEY = ("database", "code")
+EDGE_KEY = (
+    "target_database",
+    "target_code",
+    "source_database",
+    "source_code",
+    "edge_type",
+)
+# Columns with `bw2data` ids, which change whenever a database is written
+NODE_ID_COLUMNS = ("id",)
+EDGE_ID_COLUMNS = ("target_id", "source_id")
+
+
+def is_delta(dp: Datapackage) -> bool:
+    return dp.metadata.get("profile") == DELTA_PROFILE
+
+
+def validate_delta(dp: Datapackage) -> None:
+    """Raise ``ValueError`` if the ``removed`` keys or key columns of a delta aren't valid"""
+    removed = dp.metadata.get("removed")
+    if not isinstance(removed, dict):
+        raise ValueError("`removed` must be an object with `nodes` and `edges`")
+    for name, key in (("nodes", NODE_KEY), ("edges", EDGE_KEY)):
+        keys = removed.get(name, [])
+        if not isinstance(keys, list) or not all(
+            isinstance(k, list)
+            and len(k) == len(key)
+            and all(isinstance(x, str) for x in k)
+            for k in keys
+        ):
+            raise ValueError(f"`removed.{name}` must be a list of {key} keys")
+    for resource, key in ((dp.nodes_resource, NODE_KEY), (dp.edges_resource, EDGE_KEY)):
+        fields = {field["name"] for field in resource["schema"]["fields"]}
+        if not fields.issuperset(key):
+            raise ValueError(f"`{resource['path']}` must have the columns {key}")
+
+
+def _row_keys(df: pd.DataFrame, key: tuple) -> list:
+    """Key of each row of ``df``, as a tuple of strings"""
+    return list(zip(*(df[label].fillna("").astype(str).tolist() for label in key)))
+
+
+def _row_hashes(df: pd.DataFrame, id_columns: tuple) -> list:
+    """Hash of each row of ``df``, ignoring ``id_columns``"""
+    columns = [label for label in df.columns if label not in id_columns]
+    return pd.util.hash_pandas_object(df[columns], index=False).tolist()
+
+
+def _group_hashes(keys: list, hashes: list) -> dict:
+    """Hashes of the rows with each key, as ``{key: tuple}``"""
+    groups = {}
+    for key, hash in zip(keys, hashes):
+        groups.setdefault(key, []).append(hash)
+    return {key: tuple(sorted(values)) for key, values in groups.items()}
+
+
+def _changes(base: pd.DataFrame, new: pd.DataFrame, key: tuple, id_columns: tuple):
+    """Rows of ``new`` whose key group was added or changed, and removed keys"""
+    base_groups = _group_hashes(_row_keys(base, key), _row_hashes(base, id_columns))
+    new_keys = _row_keys(new, key)
+    new_groups = _group_hashes(new_keys, _row_hashes(new, id_columns))
+    changed = {k for k, hashes in new_groups.items() if base_groups.get(k) != hashes}
+    removed = sorted(set(base_groups).difference(new_groups))
+    return new[[k in changed for k in new_keys]], [list(k) for k in removed]
+
+
+def _check_columns(base: pd.DataFrame, new: pd.DataFrame, name: str) -> None:
+    if list(base.columns) != list(new.columns):
+        raise ValueError(f"Columns of `{name}` changed; upload a full package instead")
+
+
+def diff_tables(
+    base_nodes: pd.DataFrame,
+    base_edges: pd.DataFrame,
+    new_nodes: pd.DataFrame,
+    new_edges: pd.DataFrame,
+) -> Tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """Changed nodes, changed edges, and the keys of removed nodes and edges"""
+    _check_columns(base_nodes, new_nodes, "nodes")
+    _check_columns(base_edges, new_edges, "edges")
+    nodes, removed_nodes = _changes(base_nodes, new_nodes, NODE_KEY, NODE_ID_COLUMNS)
+    edges, removed_edges = _changes(base_edges, new_edges, EDGE_KEY, EDGE_ID_COLUMNS)
+    return nodes, edges, {"nodes": removed_nodes, "edges": removed_edges}
+
+
+def _relink(nodes: pd.DataFrame, edges: pd.DataFrame, fixed: int):
+    """Make node ids unique and point edges to them.
+
+    The ids of the first ``fixed`` nodes are kept; other nodes get new ids if
+    theirs is already used. Edge ids are set from the node with the same
+    key; sources in other databases keep their ids. Edges are sorted so that
+    the edges of each node are together, as `DardanellesStreamingImporter`
+    expects."""
+    ids = nodes["id"].tolist()
+    used, next_id = set(ids[:fixed]), max(ids, default=0) + 1
+    for i in range(fixed, len(ids)):
+        if ids[i] in used:
+            ids[i], next_id = next_id, next_id + 1
+        used.add(ids[i])
+    nodes = nodes.assign(id=ids)
+    lookup = dict(zip(_row_keys(nodes, NODE_KEY), ids))
+
+    edges = edges.copy()
+    for prefix in ("target", "source"):
+        keys = _row_keys(edges, (f"{prefix}_database", f"{prefix}_code"))
+        column = f"{prefix}_id"
+        edges[column] = [
+            lookup.get(key, old) for key, old in zip(keys, edges[column].tolist())
+        ]
+    return nodes, edges.sort_values("target_id", kind="stable", ignore_index=True)
+
+
+def patch_tables(
+    base_nodes: pd.DataFrame,
+    base_edges: pd.DataFrame,
+    nodes: pd.DataFrame,
+    edges: pd.DataFrame,
+    removed: dict,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Apply changed ``nodes`` and ``edges`` and ``removed`` keys to the base tables"""
+    replaced_nodes = set(map(tuple, removed["nodes"])).union(_row_keys(nodes, NODE_KEY))
+    replaced_edges = set(map(tuple, removed["edges"])).union(_row_keys(edges, EDGE_KEY))
+    kept_nodes = base_nodes[
+        [k not in replaced_nodes for k in _row_keys(base_nodes, NODE_KEY)]
+    ]
+    kept_edges = base_edges[
+        [k not in replaced_edges for k in _row_keys(base_edges, EDGE_KEY)]
+    ]
+    # Ids in the delta come from the newer export, so they take precedence
+    return _relink(
+        pd.concat([nodes, kept_nodes], ignore_index=True),
+        pd.concat([kept_edges, edges], ignore_index=True),
+        fixed=len(nodes),
+    )
+
+
+def _write_package(
+    dirpath: Path,
+    filename: str,
+    metadata: dict,
+    nodes: pd.DataFrame,
+    edges: pd.DataFrame,
+    schemas: dict,
+) -> Path:
+    """Write ``nodes`` and ``edges`` as CSV to a new datapackage"""
+    fs = generic_zipfile_filesystem(dirpath=dirpath, filename=filename, write=True)
+    metadata = {**metadata, "resources": []}
+    for name, df in (("nodes", nodes), ("edges", edges)):
+        path = f"{name}.csv"
+        metadata["resources"].append(
+            {
+                "path": path,
+                "profile": "tabular-data-resource",
+                "mediatype": "text/csv",
+                "schema": schemas[name],
+            }
+        )
+        with fs.open(path, mode="wb") as f:
+            f.write(df.to_csv(index=False).encode("utf-8"))
+    file_writer(
+        data=metadata, fs=fs, resource="datapackage.json", mimetype="application/json"
+    )
+    fs.close()
+    return Path(dirpath) / filename
+
+
+def create_delta(
+    base: Datapackage,
+    new: Datapackage,
+    base_hash: str,
+    dirpath: Union[str, Path],
+    filename: Optional[str] = None,
+) -> Path:
+    """Write a delta which turns ``base`` (with hash ``base_hash``) into ``new``.
+
+    The delta has the metadata of ``new``. Raises ``ValueError`` if the
+    columns of the nodes or edges tables differ between the two packages."""
+    nodes, edges, removed = diff_tables(base.nodes, base.edges, new.nodes, new.edges)
+    metadata = {key: value for key, value in new.metadata.items() if key != "resources"}
+    metadata.update({"profile": DELTA_PROFILE, "base": base_hash, "removed": removed})
+    return _write_package(
+        dirpath=Path(dirpath),
+        filename=filename or f"{new.name}.delta.zip",
+        metadata=metadata,
+        nodes=nodes,
+        edges=edges,
+        schemas={
+            "nodes": new.nodes_resource["schema"],
+            "edges": new.edges_resource["schema"],
+        },
+    )
+
+
+def apply_delta(
+    base: Datapackage,
+    delta: Datapackage,
+    dirpath: Union[str, Path],
+    filename: Optional[str] = None,
+) -> Path:
+    """Write the full datapackage given by applying ``delta`` to ``base``.
+
+    Nodes and edges are written as CSV. Other resources of ``base``, like
+    ``edges.npy``, are not included."""
+    if not is_delta(delta):
+        raise ValueError("Not a delta datapackage")
+    nodes, edges = patch_tables(
+        base.nodes, base.edges, delta.nodes, delta.edges, delta.metadata["removed"]
+    )
+    metadata = {
+        key: value
+        for key, value in delta.metadata.items()
+        if key not in ("resources", "base", "removed")
+    }
+    metadata["profile"] = "tabular-data-package"
+    return _write_package(
+        dirpath=Path(dirpath),
+        filename=filename or f"{delta.name}.zip",
+        metadata=metadata,
+        nodes=nodes,
+        edges=edges,
+        schemas={
+            "nodes": delta.nodes_resource["schema"],
+            "edges": delta.edges_resource["schema"],
+        },
+    )
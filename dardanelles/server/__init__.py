@@ -6,10 +6,52 @@ from pathlib import Path
 
 from flask import Flask
 
+from .filesystem import logs_dir
+from .metrics import configure_logging
+from .uploads import UploadRequest
+
 template_dir = Path(__file__).parent.resolve() / "templates"
 dardanelles_app = Flask("dardanelles", template_folder=template_dir)
+dardanelles_app.request_class = UploadRequest
 
 # Default limit for file uploads is 128 MB
 dardanelles_app.config["MAX_CONTENT_LENGTH"] = 128 * 1024 * 1024
+# Maximum size of a single datapackage; checked while the upload is received
+dardanelles_app.config["MAX_PACKAGE_SIZE"] = 128 * 1024 * 1024
+# Number of packages listed on each page of the HTML index
+dardanelles_app.config["INDEX_PAGE_SIZE"] = 100
+# Maximum size, and size of each chunk, of datapackages uploaded in chunks to
+# `/upload/session`; this is how packages above `MAX_PACKAGE_SIZE` are sent
+dardanelles_app.config["MAX_SESSION_UPLOAD_SIZE"] = 16 * 1024 * 1024 * 1024
+dardanelles_app.config["UPLOAD_CHUNK_SIZE"] = 8 * 1024 * 1024
+# Unfinished chunked uploads are deleted after this many days
+dardanelles_app.config["UPLOAD_SESSION_DAYS"] = 2
+# Number of threads validating uploads sent with `async`
+dardanelles_app.config["UPLOAD_WORKERS"] = 2
+# Uploads sent with `async` fail if not finished after this many seconds
+dardanelles_app.config["UPLOAD_JOB_TIMEOUT"] = 60 * 60
+# Maximum number of results in each page of `/search`
+dardanelles_app.config["MAX_SEARCH_RESULTS"] = 100
+# Maximum number of nodes in each page of `/package/<hash>/nodes`
+dardanelles_app.config["MAX_NODES_PAGE_SIZE"] = 1000
+# Maximum number of packages in one `/download/batch` request
+dardanelles_app.config["MAX_BATCH_SIZE"] = 100
+# Set to e.g. "/protected/" to have nginx serve downloads via `X-Accel-Redirect`
+# from `uploads_dir`. For `X-Sendfile` (Apache, lighttpd), set `USE_X_SENDFILE`.
+dardanelles_app.config["X_ACCEL_REDIRECT_PREFIX"] = None
+# Write a JSON line for each request to `logs_dir / "server.log"`. Uploads and
+# upload jobs are logged either way; use `metrics.configure_logging` to change
+# the log file or turn logging off.
+dardanelles_app.config["LOG_REQUESTS"] = True
+
+configure_logging(logs_dir / "server.log")
+
+from .migrations import migrate_database
+
+migrate_database()
 
 from . import app
+from .jobs import upload_queue
+
+# Fail jobs left unfinished by server processes which have stopped
+upload_queue.expire(dardanelles_app.config["UPLOAD_JOB_TIMEOUT"])
@@ -1,37 +1,100 @@
-import hashlib
 import json
+import math
+import tarfile
+import time
 import uuid
-from pathlib import Path
 
-from flask import Response, abort, render_template, request, send_file, url_for
-from peewee import DoesNotExist
-from werkzeug.utils import secure_filename
+from flask import (
+    Response,
+    abort,
+    g,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    url_for,
+)
+from peewee import OperationalError
+from werkzeug.exceptions import HTTPException
 
-from ..datapackage import Datapackage
 from ..version import version
 from . import dardanelles_app
-from .db import File, User
-from .filesystem import data_dir
+from .cache import catalog_cache, index_cache
+from .db import Dependency, File, UploadJob, UploadSession, User
+from .depends import latest_file, resolve
+from .ingest import check_not_uploaded, ingest, receive, record_staged, store_package
+from .jobs import upload_queue
+from .materialise import materialise
+from .metrics import (
+    logger,
+    registry,
+    request_bytes,
+    request_seconds,
+    requests_total,
+    response_bytes,
+)
+from .search import search_files
+from .sessions import (
+    assemble,
+    chunk_count,
+    claim_chunks,
+    expire_sessions,
+    received_chunks,
+    release_chunks,
+    remove_session,
+    write_chunk,
+)
+from .stats import download_counter
+from .store import blob_path, uploads_dir, valid_hash
+from .summary import load_nodes, load_summary
+from .uploads import cleanup_staged_files, keep_staged_file
 
-
-def sha256(filepath, blocksize=65536):
-    """Generate SHA 256 hash for file at `filepath`"""
-    hasher = hashlib.sha256()
-    fo = open(filepath, "rb")
-    buf = fo.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = fo.read(blocksize)
-    return hasher.hexdigest()
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
 
 
 def json_response(data):
     return Response(json.dumps(data), mimetype="application/json")
 
 
-@dardanelles_app.route("/")
-def index():
-    return render_template("index.html", table=File.select())
+@dardanelles_app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@dardanelles_app.after_request
+def record_request(response):
+    if "request_start" not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    # Unmatched URLs share one label, so 404s can't create new series
+    endpoint = request.endpoint or "none"
+    bytes_in, bytes_out = request.content_length or 0, response.content_length or 0
+    request_seconds.observe(seconds, endpoint=endpoint, method=request.method)
+    requests_total.inc(
+        endpoint=endpoint, method=request.method, status=response.status_code
+    )
+    request_bytes.inc(bytes_in, endpoint=endpoint)
+    response_bytes.inc(bytes_out, endpoint=endpoint)
+
+    if dardanelles_app.config["LOG_REQUESTS"]:
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "seconds": round(seconds, 6),
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+        }
+        if "upload_phases" in g:
+            fields["phases"] = {k: round(v, 6) for k, v in g.upload_phases.items()}
+        logger.info("request", extra={"fields": fields})
+    return response
+
+
+@dardanelles_app.teardown_request
+def remove_staged_files(exc):
+    cleanup_staged_files(request)
 
 
 @dardanelles_app.route("/ping")
@@ -39,6 +102,11 @@ def ping():
     return "pong"
 
 
+@dardanelles_app.route("/metrics")
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 @dardanelles_app.route("/register", methods=["POST"])
 def register():
     if not request.form["email_hash"] or not request.form["username"]:
@@ -63,30 +131,285 @@ def register():
     return json_response({"api_key": api_key})
 
 
+def int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, f"`{name}` must be an integer")
+    if value < 0:
+        abort(400, f"`{name}` can't be negative")
+    return value
+
+
+def catalog_query(database=None, user=None, depends=None, limit=None, offset=0):
+    query = File.select(File.filename, File.database, File.sha256)
+    if database:
+        query = query.where(File.database == database)
+    if user:
+        query = query.join(User).where(User.name == user)
+    if depends:
+        query = query.join(Dependency, on=(Dependency.file == File.id)).where(
+            Dependency.database == depends
+        )
+    total = query.count()
+    query = query.order_by(File.id).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return [(obj.filename, obj.database, obj.sha256) for obj in query], total
+
+
+@dardanelles_app.route("/")
+def index():
+    page = max(int_arg("page", 1), 1)
+    per_page = dardanelles_app.config["INDEX_PAGE_SIZE"]
+
+    def render():
+        # Join `User` so the template doesn't issue a query per row
+        table = (
+            File.select(File, User)
+            .join(User)
+            .order_by(File.id)
+            .paginate(page, per_page)
+        )
+        pages = max(math.ceil(File.select().count() / per_page), 1)
+        html = render_template("index.html", table=table, page=page, pages=pages)
+        return html.encode("utf-8"), {}
+
+    body, headers, etag = index_cache.get_or_create((page, per_page), render)
+    response = Response(body, mimetype="text/html", headers=headers)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
 @dardanelles_app.route("/catalog")
 def catalog():
-    return json_response(
-        [(Path(obj.filepath).name, obj.database, obj.sha256) for obj in File.select()]
+    filters = {
+        "database": request.args.get("database"),
+        "user": request.args.get("user"),
+        "depends": request.args.get("depends"),
+        "limit": int_arg("limit"),
+        "offset": int_arg("offset", 0),
+    }
+
+    def serialize():
+        rows, total = catalog_query(**filters)
+        return json.dumps(rows).encode("utf-8"), {"X-Total-Count": str(total)}
+
+    body, headers, etag = catalog_cache.get_or_create(
+        tuple(sorted(filters.items())), serialize
     )
+    response = Response(body, mimetype="application/json", headers=headers)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+@dardanelles_app.route("/search")
+def search():
+    q = request.args.get("q", "").strip()
+    if not q:
+        abort(400, "Missing query")
+    limit = min(int_arg("limit", 20), dardanelles_app.config["MAX_SEARCH_RESULTS"])
+
+    try:
+        rows, total = search_files(q, limit=limit, offset=int_arg("offset", 0))
+    except OperationalError:
+        abort(400, "Invalid query")
+    return json_response(rows), 200, {"X-Total-Count": str(total)}
+
+
+def file_response(filepath, download_name, etag):
+    # Files never change, so the hash is a strong ETag and clients can cache forever
+    accel_prefix = dardanelles_app.config["X_ACCEL_REDIRECT_PREFIX"]
+    if accel_prefix:
+        # Let the fronting proxy send the file, and handle ranges
+        response = Response(mimetype="application/octet-stream")
+        response.headers["X-Accel-Redirect"] = (
+            accel_prefix + filepath.relative_to(uploads_dir).as_posix()
+        )
+        response.headers["Content-Disposition"] = (
+            f"attachment; filename={download_name}"
+        )
+        response.set_etag(etag)
+        response = response.make_conditional(request, accept_ranges=False)
+    else:
+        # Sets `X-Sendfile` instead of sending data if `USE_X_SENDFILE` is
+        # enabled. Handles `If-None-Match`, `Range` and `If-Range` using `etag`.
+        response = send_file(
+            filepath,
+            mimetype="application/octet-stream",
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=etag,
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
 
 
 @dardanelles_app.route("/download/<hash>", methods=["GET"])
 def download(hash):
+    # Files are addressed by hash, so no database lookup is needed
+    if not valid_hash(hash) or not blob_path(hash).exists():
+        abort(404, "Can't find file")
+
+    response = file_response(blob_path(hash), f"{hash}.zip", hash)
+    # Don't count revalidations or resumed downloads
+    if response.status_code == 200:
+        download_counter.record(hash)
+    return response
+
+
+@dardanelles_app.route("/download/<hash>/full", methods=["GET"])
+def download_full(hash):
+    """Download a full package; deltas are applied to their base packages"""
     try:
         obj = File.get(File.sha256 == hash)
-    except DoesNotExist:
+    except File.DoesNotExist:
         abort(404, "Can't find file")
+    if obj.base is None:
+        return redirect(url_for("download", hash=hash))
 
-    return send_file(
-        obj.filepath,
-        mimetype="application/octet-stream",
-        as_attachment=True,
-        download_name=Path(obj.filepath).name,
+    try:
+        filepath = materialise(obj)
+    except File.DoesNotExist:
+        abort(404, "Can't find base package")
+    response = file_response(filepath, f"{hash}.full.zip", f"{hash}-full")
+    if response.status_code == 200:
+        download_counter.record(hash)
+    return response
+
+
+def dependencies_response(root):
+    files, missing = resolve(root)
+    return json_response(
+        {
+            "packages": [(obj.filename, obj.database, obj.sha256) for obj in files],
+            "missing": missing,
+        }
     )
 
 
+@dardanelles_app.route("/depends/<hash>")
+def depends(hash):
+    try:
+        root = File.get(File.sha256 == hash)
+    except File.DoesNotExist:
+        abort(404, "Can't find file")
+    return dependencies_response(root)
+
+
+@dardanelles_app.route("/depends")
+def depends_by_database():
+    if not request.args.get("database"):
+        abort(400, "Missing required field(s)")
+    root = latest_file(request.args["database"])
+    if root is None:
+        abort(404, "Can't find database")
+    return dependencies_response(root)
+
+
+def stored_summary(hash):
+    if not valid_hash(hash) or not blob_path(hash).exists():
+        abort(404, "Can't find file")
+    try:
+        return load_summary(hash)
+    except FileNotFoundError:
+        # Package was deleted in the meantime
+        abort(404, "Can't find file")
+
+
+def immutable_json_response(data, etag):
+    response = json_response(data)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    return response
+
+
+@dardanelles_app.route("/package/<hash>/summary")
+def package_summary(hash):
+    summary = stored_summary(hash)
+    return immutable_json_response(summary, f"{hash}-summary").make_conditional(request)
+
+
+@dardanelles_app.route("/package/<hash>/nodes")
+def package_nodes(hash):
+    summary = stored_summary(hash)
+    limit = min(int_arg("limit", 100), dardanelles_app.config["MAX_NODES_PAGE_SIZE"])
+    offset = int_arg("offset", 0)
+    try:
+        nodes = load_nodes(hash, offset, limit)
+    except FileNotFoundError:
+        abort(404, "Can't find file")
+    response = immutable_json_response(nodes, f"{hash}-nodes-{offset}-{limit}")
+    response.headers["X-Total-Count"] = str(summary["nodes"])
+    return response.make_conditional(request)
+
+
+def tar_stream(hashes, blocksize=65536):
+    """Generate an uncompressed tar archive of the packages for `hashes`"""
+    for hash in hashes:
+        filepath = blob_path(hash)
+        info = tarfile.TarInfo(f"{hash}.zip")
+        info.size = filepath.stat().st_size
+        info.mtime = int(filepath.stat().st_mtime)
+        yield info.tobuf()
+        with open(filepath, "rb") as f:
+            buf = f.read(blocksize)
+            while len(buf) > 0:
+                yield buf
+                buf = f.read(blocksize)
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+@dardanelles_app.route("/download/batch", methods=["POST"])
+def download_batch():
+    """Download several packages as one tar archive of `<sha256>.zip` files.
+
+    The hashes are given as the repeated form field `sha256`."""
+    hashes = list(dict.fromkeys(request.form.getlist("sha256")))
+    if not hashes:
+        abort(400, "Missing required field(s)")
+    if len(hashes) > dardanelles_app.config["MAX_BATCH_SIZE"]:
+        abort(413, "Too many files requested")
+
+    missing = [
+        hash for hash in hashes if not valid_hash(hash) or not blob_path(hash).exists()
+    ]
+    if missing:
+        abort(404, "Can't find file(s): " + ", ".join(missing))
+
+    for hash in hashes:
+        download_counter.record(hash)
+    return Response(tar_stream(hashes), mimetype="application/x-tar")
+
+
+def authenticate(api_key):
+    try:
+        return User.get(User.api_key == api_key)
+    except User.DoesNotExist:
+        abort(406, "api_key not correct")
+
+
 @dardanelles_app.route("/upload", methods=["POST"])
 def upload():
+    # Reject before the request body is read where possible
+    if (
+        request.content_length
+        and request.content_length > dardanelles_app.config["MAX_PACKAGE_SIZE"]
+    ):
+        abort(413, "Upload too large")
+
     if (
         not request.form["sha256"]
         or not request.form["database"]
@@ -95,44 +418,181 @@ def upload():
     ):
         abort(400, "Missing required field(s)")
 
+    user = authenticate(request.form["api_key"])
+    staged = receive(request.files["file"], request.form["sha256"])
+    return store_response(
+        user, staged, request.form["filename"], request.form["database"]
+    )
+
+
+def store_response(user, staged, filename, database):
+    """Store the received package `staged`, in the background if `async` is set"""
+    if request.form.get("async", "").lower() not in ("1", "true", "yes"):
+        return json_response(
+            store_package(user, staged.path, staged.hexdigest(), filename, database)
+        )
+
+    # Validate and store in the background; the client polls `/upload/<job>`
+    keep_staged_file(request, staged)
+    job = upload_queue.submit(
+        user=user,
+        path=staged.path,
+        sha256=staged.hexdigest(),
+        filename=filename,
+        database=database,
+    )
+    return (
+        json_response(job.as_dict()),
+        202,
+        {"Location": url_for("upload_status", job=job.id)},
+    )
+
+
+@dardanelles_app.route("/upload/<job>", methods=["GET"])
+def upload_status(job):
     try:
-        user = User.get(User.api_key == request.form["api_key"])
-    except User.DoesNotExist:
+        job = UploadJob.get_by_id(job)
+    except UploadJob.DoesNotExist:
+        abort(404, "Can't find upload job")
+    if job.status in UploadJob.PENDING:
+        # Fail the job if its server process stopped
+        upload_queue.expire(dardanelles_app.config["UPLOAD_JOB_TIMEOUT"])
+        job = UploadJob.get_by_id(job.id)
+    return json_response(job.as_dict())
+
+
+@dardanelles_app.route("/upload/session", methods=["POST"])
+def create_upload_session():
+    """Start, or resume, an upload sent in chunks"""
+    fields = ["sha256", "size", "database", "filename", "api_key"]
+    if not all(request.form.get(field) for field in fields):
+        abort(400, "Missing required field(s)")
+    try:
+        size = int(request.form["size"])
+    except ValueError:
+        abort(400, "`size` must be an integer")
+    if size <= 0:
+        abort(400, "`size` must be positive")
+    if size > dardanelles_app.config["MAX_SESSION_UPLOAD_SIZE"]:
+        abort(413, "Upload too large")
+
+    user = authenticate(request.form["api_key"])
+    check_not_uploaded(request.form["sha256"])
+    expire_sessions(dardanelles_app.config["UPLOAD_SESSION_DAYS"])
+
+    session, _ = UploadSession.get_or_create(
+        user=user,
+        sha256=request.form["sha256"],
+        defaults={
+            "size": size,
+            "chunk_size": dardanelles_app.config["UPLOAD_CHUNK_SIZE"],
+            "filename": request.form["filename"],
+            "database": request.form["database"],
+        },
+    )
+    if session.size != size:
+        abort(409, "An upload of this hash with a different size is in progress")
+    return json_response(session.as_dict(received_chunks(session)))
+
+
+def get_upload_session(session_id):
+    """Upload session `session_id`, if it belongs to the user with the `api_key`
+    form field or query parameter"""
+    if not request.values.get("api_key"):
+        abort(400, "Missing required field(s)")
+    user = authenticate(request.values["api_key"])
+    try:
+        session = UploadSession.get_by_id(session_id)
+    except UploadSession.DoesNotExist:
+        abort(404, "Can't find upload session")
+    if session.user_id != user.id:
         abort(406, "api_key not correct")
+    return session
 
-    their_hash = request.form["sha256"]
-    filename = secure_filename(request.form["filename"])
-    database = request.form["database"]
-    file_obj = request.files["file"]
-    new_name = uuid.uuid4().hex[:16] + "." + filename
-    filepath = data_dir / "uploads" / new_name
-    file_obj.save(filepath)
-    our_hash = sha256(filepath)
-
-    # Provided hash is incorrect
-    if our_hash != their_hash:
-        filepath.unlink()
-        abort(406, "Can't reproduce provided hash value")
 
-    # Hash already exists
-    if File.select().where(File.sha256 == our_hash).count():
-        filepath.unlink()
-        abort(409, "This file hash is already uploaded")
+@dardanelles_app.route("/upload/session/<session_id>", methods=["GET"])
+def upload_session_status(session_id):
+    session = get_upload_session(session_id)
+    return json_response(session.as_dict(received_chunks(session)))
 
+
+@dardanelles_app.route("/upload/session/<session_id>/<int:index>", methods=["PUT"])
+def upload_chunk(session_id, index):
+    session = get_upload_session(session_id)
+    write_chunk(session, index, request.stream)
+    return json_response({"session": session.id, "chunk": index})
+
+
+@dardanelles_app.route("/upload/session/<session_id>/finish", methods=["POST"])
+def finish_upload_session(session_id):
+    session = get_upload_session(session_id)
+    # Only one request finishes a session; the session is kept until the
+    # upload is stored or definitely rejected, so the client can retry
+    claimed = claim_chunks(session)
     try:
-        dp = Datapackage(filepath)
-        assert len(dp.nodes)
-    except:
-        filepath.unlink()
-        abort(406, "Can't load datapackage")
+        received = received_chunks(session, claimed)
+        missing = sorted(set(range(chunk_count(session))) - set(received))
+        if missing:
+            abort(400, f"Missing chunks: {missing}")
+        staged = assemble(session, claimed)
+    except BaseException:
+        release_chunks(session, claimed)
+        raise
+    request.staged_files.append(staged)
+    record_staged(staged)
 
-    File(
-        user=user,
-        filepath=str(filepath),
-        database=database,
-        depends=dp.depends,
-        description=dp.description,
-        sha256=our_hash,
-    ).save()
+    # Provided hash is incorrect; chunks can be sent again
+    if staged.hexdigest() != session.sha256:
+        release_chunks(session, claimed)
+        abort(406, "Can't reproduce provided hash value")
+
+    try:
+        check_not_uploaded(session.sha256)
+        response = store_response(
+            session.user, staged, session.filename, session.database
+        )
+    except HTTPException:
+        remove_session(session, claimed)
+        raise
+    except BaseException:
+        release_chunks(session, claimed)
+        raise
+    remove_session(session, claimed)
+    return response
+
+
+@dardanelles_app.route("/upload/batch", methods=["POST"])
+def upload_batch():
+    """Upload several datapackages in one request.
+
+    Form fields ``sha256``, ``database``, ``filename`` and files ``file`` are
+    repeated, once per package, in the same order. Returns a list with the
+    result of each upload. The whole request is limited by ``MAX_CONTENT_LENGTH``."""
+    if not request.form.get("api_key"):
+        abort(400, "Missing required field(s)")
+    user = authenticate(request.form["api_key"])
+
+    fields = [
+        request.form.getlist("sha256"),
+        request.form.getlist("database"),
+        request.form.getlist("filename"),
+        request.files.getlist("file"),
+    ]
+    if not fields[0] or len({len(values) for values in fields}) != 1:
+        abort(400, "Missing required field(s)")
 
-    return json_response({"filename": new_name, "sha256": our_hash})
+    results = []
+    for their_hash, database, filename, file_obj in zip(*fields):
+        try:
+            if not their_hash or not database or not filename:
+                abort(400, "Missing required field(s)")
+            result = ingest(user, file_obj, their_hash, filename, database)
+            result["status"] = 200
+        except HTTPException as exc:
+            result = {
+                "sha256": their_hash,
+                "status": exc.code,
+                "message": exc.description,
+            }
+        results.append(result)
+    return json_response(results)
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable, Optional, Tuple
+
+from .filesystem import data_dir
+from .metrics import cache_requests
+
+
+class ResponseCache:
+    """Thread-safe in-memory cache of serialised response bodies.
+
+    Entries are created by a function returning ``(body, headers)``, and are
+    stored as ``(body, headers, etag)`` tuples. The whole cache is cleared with
+    ``invalidate`` whenever the underlying data changes; the least recently
+    used entry is dropped once there are more than ``max_entries``.
+
+    If ``stamp`` is given, invalidation touches that file, and every cache
+    sharing the same ``stamp`` (e.g. in other server worker processes) drops
+    its entries when it sees the new modification time.
+
+    Minor changes which shouldn't each invalidate the cache are reported with
+    ``add_changes``; the cache is invalidated once more than
+    ``change_threshold`` of them have accumulated.
+
+    Hits and misses are counted in the ``cache_requests`` metric as ``name``."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        stamp: Optional[Path] = None,
+        change_threshold: int = 0,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.stamp = stamp
+        self.change_threshold = change_threshold
+        self._changes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stamp_seen = self._read_stamp()
+
+    def _read_stamp(self) -> Optional[int]:
+        try:
+            return os.stat(self.stamp).st_mtime_ns
+        except (TypeError, FileNotFoundError):
+            return None
+
+    def _check_stamp(self) -> None:
+        stamp = self._read_stamp()
+        if stamp != self._stamp_seen:
+            self._entries.clear()
+            self._generation += 1
+            self._stamp_seen = stamp
+
+    def get_or_create(
+        self, key: Hashable, func: Callable[[], Tuple[bytes, dict]]
+    ) -> Tuple[bytes, dict, str]:
+        with self._lock:
+            self._check_stamp()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                cache_requests.inc(cache=self.name, result="hit")
+                return self._entries[key]
+            generation = self._generation
+
+        cache_requests.inc(cache=self.name, result="miss")
+
+        body, headers = func()
+        entry = (body, headers, hashlib.sha1(body).hexdigest())
+
+        with self._lock:
+            # Don't store results computed from data that changed in the meantime
+            if generation != self._generation:
+                return entry
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def add_changes(self, count: int = 1) -> None:
+        with self._lock:
+            self._changes += count
+            if self._changes <= self.change_threshold:
+                return
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._changes = 0
+            if self.stamp is not None:
+                self.stamp.touch()
+                now = time.time_ns()
+                os.utime(self.stamp, ns=(now, now))
+                self._stamp_seen = self._read_stamp()
+
+
+catalog_cache = ResponseCache("catalog", stamp=data_dir / "catalog.stamp")
+# Download counts shown on the index page may lag by up to `change_threshold`
+index_cache = ResponseCache(
+    "index", stamp=data_dir / "index.stamp", change_threshold=100
+)
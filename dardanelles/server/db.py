@@ -1,6 +1,8 @@
 import datetime
 import json
 import os
+import time
+import uuid
 
 from peewee import (
     DateTimeField,
@@ -10,12 +12,41 @@ from peewee import (
     SqliteDatabase,
     TextField,
 )
+from playhouse.sqlite_ext import FTS5Model, RowIDField, SearchField
 
 from .filesystem import data_dir
+from .metrics import sqlite_query_seconds
+
+
+class InstrumentedSqliteDatabase(SqliteDatabase):
+    """`SqliteDatabase` which records the number and execution time of statements"""
+
+    def execute_sql(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, *args, **kwargs)
+        finally:
+            sqlite_query_seconds.observe(
+                time.perf_counter() - start, statement=sql.split(None, 1)[0].upper()
+            )
+
 
 db_filepath = os.path.join(data_dir, "dardanelles.db")
 print("Using database at", db_filepath)
-sql_database = SqliteDatabase(db_filepath)
+sql_database = InstrumentedSqliteDatabase(
+    db_filepath,
+    pragmas={
+        # Readers don't block the writer, and vice versa
+        "journal_mode": "wal",
+        # Safe with WAL; only the last transactions can be lost on power failure
+        "synchronous": "normal",
+        "foreign_keys": 1,
+        # 64 MB page cache
+        "cache_size": -64 * 1024,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "memory",
+    },
+)
 
 
 class JSONField(TextField):
@@ -24,11 +55,13 @@ class JSONField(TextField):
             json.dumps(
                 value,
                 ensure_ascii=False,
-                indent=2,
+                separators=(",", ":"),
             )
         )
 
     def python_value(self, value):
+        if value is None:
+            return None
         return json.loads(value)
 
 
@@ -44,16 +77,114 @@ class User(Model):
 class File(Model):
     user = ForeignKeyField(User)
     filepath = TextField()
+    filename = TextField(null=True)
     sha256 = TextField(unique=True)
     database = TextField()
     description = TextField()
     depends = JSONField(default=[])
-    created = DateTimeField(default=datetime.datetime.now)
+    created = DateTimeField(default=datetime.datetime.now, index=True)
     accessed = DateTimeField(default=datetime.datetime.now)
     count = IntegerField(default=0)
+    # Hash of the package this delta applies to; `None` for full packages
+    base = TextField(null=True)
+
+    class Meta:
+        database = sql_database
+        # Filtering by database name, and finding its latest upload
+        indexes = ((("database", "created"), False),)
+
+
+class Dependency(Model):
+    """Database names that each `File` depends on; mirrors `File.depends`"""
+
+    file = ForeignKeyField(File, backref="dependencies", on_delete="CASCADE")
+    database = TextField(index=True)
+
+    class Meta:
+        database = sql_database
+        indexes = ((("file", "database"), True),)
+
+
+class FileIndex(FTS5Model):
+    """Full-text index of searchable package metadata; `rowid` is `File.id`"""
+
+    rowid = RowIDField()
+    name = SearchField()
+    description = SearchField()
+    licenses = SearchField()
+    # Node names, locations and categories, one per line
+    nodes = SearchField()
 
     class Meta:
         database = sql_database
+        options = {"tokenize": "porter unicode61 remove_diacritics 2"}
+
+
+class UploadJob(Model):
+    """Upload being validated and stored in the background; see `jobs.UploadQueue`"""
+
+    PENDING = ("queued", "processing")
+
+    id = TextField(primary_key=True, default=lambda: uuid.uuid4().hex)
+    user = ForeignKeyField(User)
+    sha256 = TextField(index=True)
+    filename = TextField()
+    database = TextField()
+    # One of "queued", "processing", "done" or "failed"
+    status = TextField(default="queued")
+    # HTTP status code and message or result of the finished upload
+    code = IntegerField(null=True)
+    message = TextField(null=True)
+    result = JSONField(null=True)
+    created = DateTimeField(default=datetime.datetime.now)
+    finished = DateTimeField(null=True, index=True)
+    # Staged file, and the `UploadQueue` running the job; see `UploadQueue.expire`
+    path = TextField(null=True)
+    worker = TextField(null=True)
+
+    class Meta:
+        database = sql_database
+
+    def as_dict(self) -> dict:
+        return {
+            "job": self.id,
+            "status": self.status,
+            "sha256": self.sha256,
+            "code": self.code,
+            "message": self.message,
+            "result": self.result,
+        }
+
+
+class UploadSession(Model):
+    """Upload sent in numbered chunks; see `sessions`"""
+
+    id = TextField(primary_key=True, default=lambda: uuid.uuid4().hex)
+    user = ForeignKeyField(User)
+    sha256 = TextField()
+    size = IntegerField()
+    chunk_size = IntegerField()
+    filename = TextField()
+    database = TextField()
+    created = DateTimeField(default=datetime.datetime.now, index=True)
+
+    class Meta:
+        database = sql_database
+        indexes = ((("user", "sha256"), True),)
+
+    def as_dict(self, received: list) -> dict:
+        return {
+            "session": self.id,
+            "sha256": self.sha256,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "received": received,
+        }
 
 
-sql_database.create_tables([File, User], safe=True)
+def add_dependencies(obj):
+    names = sorted(set(obj.depends))
+    if names:
+        Dependency.insert_many(
+            [{"file": obj, "database": name} for name in names]
+        ).on_conflict_ignore().execute()
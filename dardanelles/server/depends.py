@@ -0,0 +1,67 @@
+from typing import Iterable, List, Optional, Tuple
+
+from .db import Dependency, File
+
+
+def latest_files(names: Iterable[str]) -> dict:
+    """Most recently uploaded `File` for each database name in `names`"""
+    names = list(names)
+    if not names:
+        return {}
+    query = File.select().where(File.database.in_(names)).order_by(File.created)
+    return {obj.database: obj for obj in query}
+
+
+def latest_file(name: str) -> Optional[File]:
+    return latest_files([name]).get(name)
+
+
+def resolve(root: File) -> Tuple[List[File], List[str]]:
+    """Find the transitive dependencies of `root`.
+
+    Each dependency is resolved to the most recent upload of that database.
+    The dependency graph is walked one level at a time, with one query for
+    the dependency names and one for their files at each level.
+
+    Returns the files in topological order, dependencies first and `root`
+    last, and the sorted names of databases which aren't on this server."""
+    chosen = {root.database: root}
+    depends_on = {}
+    missing = set()
+    frontier = [root]
+
+    while frontier:
+        query = Dependency.select(Dependency.file, Dependency.database).where(
+            Dependency.file.in_([obj.id for obj in frontier])
+        )
+        for row in query.order_by(Dependency.id):
+            depends_on.setdefault(row.file_id, []).append(row.database)
+
+        new_names = {
+            name
+            for obj in frontier
+            for name in depends_on.get(obj.id, [])
+            if name not in chosen and name not in missing
+        }
+        found = latest_files(new_names)
+        missing.update(new_names.difference(found))
+        chosen.update(found)
+        frontier = list(found.values())
+
+    # Depth-first post-order; cycles are broken at the first repeated file
+    order, seen = [], set()
+    stack = [(root, iter(depends_on.get(root.id, [])))]
+    seen.add(root.id)
+    while stack:
+        obj, children = stack[-1]
+        for name in children:
+            child = chosen.get(name)
+            if child is not None and child.id not in seen:
+                seen.add(child.id)
+                stack.append((child, iter(depends_on.get(child.id, []))))
+                break
+        else:
+            stack.pop()
+            order.append(obj)
+
+    return order, sorted(missing)
@@ -10,10 +10,12 @@ def create_dir(dirpath):
 
 
 data_dir = Path(appdirs.user_data_dir("dardanelles", "dd"))
+staging_dir = data_dir / "staging"
 logs_dir = Path(appdirs.user_log_dir("dardanelles", "dd"))
 
 data_dir.mkdir(exist_ok=True)
 (data_dir / "uploads").mkdir(parents=True, exist_ok=True)
+staging_dir.mkdir(parents=True, exist_ok=True)
 logs_dir.mkdir(parents=True, exist_ok=True)
 
 print(f"dardanelles remote: Data directory is {data_dir}")
@@ -0,0 +1,140 @@
+import datetime
+from pathlib import Path
+
+from flask import abort, current_app
+from peewee import IntegrityError
+from werkzeug.utils import secure_filename
+
+from ..datapackage import Datapackage
+from ..delta import is_delta, validate_delta
+from .cache import catalog_cache, index_cache
+from .db import File, UploadJob, add_dependencies, sql_database
+from .metrics import logger, record_phase, upload_phase
+from .search import index_file, search_document
+from .store import add_blob
+from .summary import add_summary, build_summary
+from .uploads import HashingFile
+
+
+def check_not_uploaded(their_hash):
+    # Hash already exists
+    if File.select().where(File.sha256 == their_hash).exists():
+        abort(409, "This file hash is already uploaded")
+    # Jobs past their timeout are failed by `UploadQueue.expire`
+    cutoff = datetime.datetime.now() - datetime.timedelta(
+        seconds=current_app.config["UPLOAD_JOB_TIMEOUT"]
+    )
+    if (
+        UploadJob.select()
+        .where(
+            UploadJob.sha256 == their_hash,
+            UploadJob.status.in_(UploadJob.PENDING),
+            UploadJob.created >= cutoff,
+        )
+        .exists()
+    ):
+        abort(409, "This file hash is already being uploaded")
+
+
+def record_staged(staged: HashingFile) -> None:
+    record_phase("save", staged.write_seconds)
+    record_phase("hash", staged.hash_seconds)
+
+
+def receive(file_obj, their_hash) -> HashingFile:
+    """Check an uploaded file against its expected hash, returning the staged file"""
+    with upload_phase("dedupe"):
+        check_not_uploaded(their_hash)
+
+    # File was hashed while being received; see `uploads.HashingFile`
+    staged = file_obj.stream
+    if not isinstance(staged, HashingFile):
+        abort(400, "Upload must be sent as multipart form data")
+    record_staged(staged)
+
+    # Provided hash is incorrect
+    if staged.hexdigest() != their_hash:
+        abort(406, "Can't reproduce provided hash value")
+
+    staged.close()
+    return staged
+
+
+def store_package(user, path: Path, their_hash, filename, database) -> dict:
+    """Validate the datapackage at `path` and add it to the store and database.
+
+    `path` is moved into the store; aborts if the package isn't valid."""
+    filename = secure_filename(filename)
+
+    # Validate while still staged, so only valid packages enter the store
+    try:
+        with upload_phase("parse"):
+            dp = Datapackage(path, lazy=True)
+            counts = dp.validate()
+            if is_delta(dp):
+                validate_delta(dp)
+            else:
+                assert counts[dp.nodes_resource["path"]]
+            document = search_document(dp)
+            summary = build_summary(dp, counts)
+    except ImportError:
+        # `pyarrow` isn't installed
+        abort(415, "This server can't read Parquet resources")
+    except:
+        logger.info(
+            "invalid upload",
+            exc_info=True,
+            extra={"fields": {"sha256": their_hash, "filename": filename}},
+        )
+        abort(406, "Can't load datapackage")
+
+    base = dp.metadata["base"] if is_delta(dp) else None
+    if base is not None and not File.select().where(File.sha256 == base).exists():
+        abort(406, "Base package of this delta isn't on this server")
+
+    with upload_phase("store"):
+        # Sidecars are written first, so that the staged file is still there
+        add_summary(their_hash, dp, summary)
+        filepath = add_blob(path, their_hash)
+
+    try:
+        with upload_phase("insert"), sql_database.atomic():
+            obj = File.create(
+                user=user,
+                filepath=str(filepath),
+                filename=filename,
+                database=database,
+                depends=dp.depends,
+                description=dp.description,
+                sha256=their_hash,
+                base=base,
+            )
+            add_dependencies(obj)
+            index_file(obj, document)
+    except IntegrityError:
+        # Same package uploaded concurrently
+        abort(409, "This file hash is already uploaded")
+    catalog_cache.invalidate()
+    index_cache.invalidate()
+    logger.info(
+        "package stored",
+        extra={
+            "fields": {
+                "sha256": their_hash,
+                "filename": filename,
+                "database": database,
+                "user": user.name,
+                "size": filepath.stat().st_size,
+                "nodes": summary["nodes"],
+                "edges": summary["edges"],
+            }
+        },
+    )
+
+    return {"filename": filepath.name, "sha256": their_hash}
+
+
+def ingest(user, file_obj, their_hash, filename, database):
+    """Check and store an uploaded datapackage, aborting if it isn't valid"""
+    staged = receive(file_obj, their_hash)
+    return store_package(user, staged.path, their_hash, filename, database)
@@ -0,0 +1,202 @@
+import datetime
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from flask import current_app, g
+from werkzeug.exceptions import HTTPException
+
+from .db import UploadJob
+from .filesystem import staging_dir
+from .ingest import store_package
+from .metrics import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def lock_path(worker: str) -> Path:
+    return staging_dir / f"{worker}.lock"
+
+
+def worker_alive(worker) -> bool:
+    """Check whether the `UploadQueue` with id `worker` is still running.
+
+    Each queue holds an exclusive lock on its lock file for as long as its
+    process runs. Without `fcntl` (i.e. on Windows) this can't be checked,
+    and only the timeout in `UploadQueue.expire` applies."""
+    if worker is None:
+        return False
+    elif fcntl is None:
+        return True
+    try:
+        f = open(lock_path(worker), "rb")
+    except FileNotFoundError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    lock_path(worker).unlink(missing_ok=True)
+    return False
+
+
+class UploadQueue:
+    """Validate and store staged uploads on a pool of background threads.
+
+    Job state is kept in `UploadJob`, so that any server process can report
+    it. Jobs are only run by the process which accepted them; queued jobs
+    are finished before the interpreter exits. Jobs of processes which were
+    killed, and jobs which take too long, are failed by `expire`. The number
+    of threads is set by the `UPLOAD_WORKERS` config value. Finished jobs are
+    deleted after `keep_days`."""
+
+    def __init__(self, keep_days: int = 7):
+        self.keep_days = keep_days
+        # Set when the first job is submitted, by each process
+        self.worker = None
+        self._pid = None
+        self._executor = None
+        self._lockfile = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self, app) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Server workers forked after the queue was created (e.g. with
+                # `gunicorn --preload`) each need their own id and threads
+                if self._lockfile is not None:
+                    self._lockfile.close()
+                self._pid, self.worker = os.getpid(), uuid.uuid4().hex
+                self._executor, self._lockfile = None, None
+            if self._executor is None:
+                # Held until the process exits; see `worker_alive`
+                lockfile = open(lock_path(self.worker), "wb")
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        lockfile.close()
+                        raise RuntimeError(
+                            f"Upload worker lock {lock_path(self.worker)} is held "
+                            "by another process"
+                        )
+                self._lockfile = lockfile
+                self._executor = ThreadPoolExecutor(
+                    max_workers=app.config["UPLOAD_WORKERS"],
+                    thread_name_prefix="upload",
+                )
+            return self._executor
+
+    def submit(self, user, path: Path, sha256, filename, database) -> UploadJob:
+        app = current_app._get_current_object()
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.keep_days)
+        UploadJob.delete().where(UploadJob.finished < cutoff).execute()
+        self.expire(app.config["UPLOAD_JOB_TIMEOUT"])
+
+        executor = self._get_executor(app)
+        job = UploadJob.create(
+            user=user,
+            sha256=sha256,
+            filename=filename,
+            database=database,
+            path=str(path),
+            worker=self.worker,
+        )
+        executor.submit(self._run, app, job.id, Path(path))
+        return job
+
+    def expire(self, timeout: float) -> None:
+        """Fail pending jobs whose process has stopped, or which were created
+        more than `timeout` seconds ago.
+
+        Staged files of jobs whose process has stopped are deleted; running
+        processes delete those of their own jobs when the job finishes, or
+        when it's skipped because it already failed."""
+        now = datetime.datetime.now()
+        cutoff = now - datetime.timedelta(seconds=timeout)
+        query = UploadJob.select().where(UploadJob.status.in_(UploadJob.PENDING))
+        for job in query:
+            alive = worker_alive(job.worker)
+            if job.created < cutoff:
+                message = "Upload wasn't finished in time; please try again"
+            elif not alive:
+                message = "Upload was interrupted by a server restart; please try again"
+            else:
+                continue
+            failed = (
+                UploadJob.update(
+                    status="failed", code=500, message=message, finished=now
+                )
+                .where(UploadJob.id == job.id, UploadJob.status.in_(UploadJob.PENDING))
+                .execute()
+            )
+            if failed and job.path and not alive:
+                Path(job.path).unlink(missing_ok=True)
+
+        # Lock files of stopped processes are deleted by `worker_alive`
+        for path in staging_dir.glob("*.lock"):
+            worker_alive(path.stem)
+
+    def _run(self, app, job_id: str, path: Path) -> None:
+        # Unless the job expired while queued
+        started = (
+            UploadJob.update(status="processing")
+            .where(UploadJob.id == job_id, UploadJob.status == "queued")
+            .execute()
+        )
+        if not started:
+            path.unlink(missing_ok=True)
+            return
+        job = UploadJob.get_by_id(job_id)
+        start, phases = time.perf_counter(), {}
+        result, message = None, None
+        try:
+            # So `abort` raises the same exceptions as in a request
+            with app.app_context():
+                g.upload_phases = phases
+                result = store_package(
+                    job.user, path, job.sha256, job.filename, job.database
+                )
+        except HTTPException as exc:
+            status, code, message = "failed", exc.code, exc.description
+        except Exception:
+            traceback.print_exc()
+            status, code, message = "failed", 500, "Internal server error"
+        else:
+            status, code = "done", 200
+        finally:
+            if path.exists():
+                path.unlink()
+        # Keep the result of `expire` if the job timed out in the meantime
+        UploadJob.update(
+            status=status,
+            code=code,
+            message=message,
+            result=result,
+            finished=datetime.datetime.now(),
+        ).where(UploadJob.id == job_id, UploadJob.status == "processing").execute()
+        job = UploadJob.get_by_id(job_id)
+        logger.info(
+            "upload job",
+            extra={
+                "fields": {
+                    "job": job.id,
+                    "sha256": job.sha256,
+                    "status": job.status,
+                    "code": job.code,
+                    "seconds": round(time.perf_counter() - start, 6),
+                    "phases": {k: round(v, 6) for k, v in phases.items()},
+                }
+            },
+        )
+
+
+upload_queue = UploadQueue()
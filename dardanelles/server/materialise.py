@@ -0,0 +1,41 @@
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from ..datapackage import Datapackage
+from ..delta import apply_delta
+from .db import File
+from .store import blob_path
+
+_lock = threading.Lock()
+
+
+def full_path(sha256: str) -> Path:
+    """Location of the full datapackage materialised from delta `sha256`"""
+    return blob_path(sha256).with_suffix(".full.zip")
+
+
+def materialise(obj: File) -> Path:
+    """Path to the full datapackage for `obj`, applying deltas to their bases as needed.
+
+    Materialised packages are kept next to the stored delta."""
+    if obj.base is None:
+        return blob_path(obj.sha256)
+    target = full_path(obj.sha256)
+    if target.exists():
+        return target
+
+    base = materialise(File.get(File.sha256 == obj.base))
+    # One package at a time; materialising can use a lot of memory
+    with _lock:
+        if not target.exists():
+            tmp_name = f".{uuid.uuid4().hex}.tmp"
+            apply_delta(
+                Datapackage(base, lazy=True),
+                Datapackage(blob_path(obj.sha256), lazy=True),
+                dirpath=target.parent,
+                filename=tmp_name,
+            )
+            os.replace(target.parent / tmp_name, target)
+    return target
@@ -0,0 +1,277 @@
+"""Request, upload, database and cache metrics, and structured logs.
+
+Metrics are kept in memory by each server process, and rendered in the
+Prometheus text format by ``/metrics``. Recording a value takes a lock and
+updates a dictionary, so instrumentation can be left on in production. With
+several worker processes, each reports only its own requests.
+
+Log records of the ``dardanelles.server`` logger are written to ``logs_dir``
+as JSON lines; see ``configure_logging``."""
+
+import bisect
+import datetime
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import WatchedFileHandler
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from flask import g, has_app_context
+
+logger = logging.getLogger("dardanelles.server")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Metric:
+    """Base class for metrics; values are stored by tuple of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self) -> Iterable[tuple]:
+        """Generate ``(name, labels, value)`` for each sample"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(
+            f"{name}{format_labels(labels)} {value:g}"
+            for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._callbacks = []
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def add_callback(self, func: Callable[[], dict]) -> None:
+        """Add counts returned by ``func`` when rendering.
+
+        ``func`` returns a dictionary of label value tuples to counts; used for
+        counts which are already kept elsewhere, like ``functools.lru_cache``
+        statistics."""
+        self._callbacks.append(func)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for func in self._callbacks:
+            for key, value in func().items():
+                values[key] = values.get(key, 0) + value
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._values:
+                # Count in each bucket (the last is +Inf), and sum
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = self._values[key]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(c), s)) for key, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket", {**labels, "le": le}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.add(
+    Histogram(
+        "dardanelles_request_duration_seconds",
+        "Time to handle requests, by endpoint",
+        labels=("endpoint", "method"),
+    )
+)
+requests_total = registry.add(
+    Counter(
+        "dardanelles_requests_total",
+        "Requests handled, by endpoint and status code",
+        labels=("endpoint", "method", "status"),
+    )
+)
+request_bytes = registry.add(
+    Counter(
+        "dardanelles_request_bytes_total",
+        "Request body bytes received",
+        labels=("endpoint",),
+    )
+)
+response_bytes = registry.add(
+    Counter(
+        "dardanelles_response_bytes_total",
+        "Response body bytes sent, where the length is known in advance",
+        labels=("endpoint",),
+    )
+)
+upload_phase_seconds = registry.add(
+    Histogram(
+        "dardanelles_upload_phase_seconds",
+        "Time spent in each phase of storing uploads: save (writing to disk), "
+        "hash, dedupe (checking for existing uploads), parse (validating the "
+        "datapackage), store (moving into the store) and insert (database)",
+        labels=("phase",),
+    )
+)
+sqlite_query_seconds = registry.add(
+    Histogram(
+        "dardanelles_sqlite_query_seconds",
+        "Time to execute SQLite statements, by statement type",
+        labels=("statement",),
+    )
+)
+cache_requests = registry.add(
+    Counter(
+        "dardanelles_cache_requests_total",
+        "Cache lookups, by cache and result (hit or miss)",
+        labels=("cache", "result"),
+    )
+)
+
+
+def lru_cache_counts(name: str, func) -> Callable[[], dict]:
+    """Hit and miss counts of the ``lru_cache`` ``func``, for ``Counter.add_callback``"""
+
+    def counts():
+        info = func.cache_info()
+        return {(name, "hit"): info.hits, (name, "miss"): info.misses}
+
+    return counts
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Record time spent in an upload phase.
+
+    Within an app context, the time is also added to ``g.upload_phases``,
+    which is included in the log record of the request or upload job."""
+    upload_phase_seconds.observe(seconds, phase=phase)
+    if has_app_context():
+        phases = g.setdefault("upload_phases", {})
+        phases[phase] = phases.get(phase, 0) + seconds
+
+
+@contextmanager
+def upload_phase(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - start)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format log records as JSON objects, one per line.
+
+    The message is stored as ``event``, and the ``fields`` dictionary passed
+    with ``extra`` is added to the object."""
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, separators=(",", ":"))
+
+
+def configure_logging(filepath: Optional[Path], level=logging.INFO) -> None:
+    """Write server log records to ``filepath``; if ``None``, don't log.
+
+    ``WatchedFileHandler`` reopens the file if it's rotated, e.g. by ``logrotate``."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.propagate = False
+    if filepath is None:
+        logger.disabled = True
+        return
+    handler = WatchedFileHandler(filepath, encoding="utf-8", delay=True)
+    handler.setFormatter(JSONFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.disabled = False
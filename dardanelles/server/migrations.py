@@ -0,0 +1,129 @@
+from pathlib import Path
+
+from peewee import JOIN
+from playhouse.migrate import SqliteMigrator, migrate
+
+from ..datapackage import Datapackage
+from .db import (
+    Dependency,
+    File,
+    FileIndex,
+    UploadJob,
+    UploadSession,
+    User,
+    add_dependencies,
+    sql_database,
+)
+from .search import index_file, search_document
+from .store import add_blob, blob_path
+
+MODELS = [File, User, Dependency, FileIndex, UploadJob, UploadSession]
+
+
+def add_column(model, name):
+    table = model._meta.table_name
+    columns = {column.name for column in sql_database.get_columns(table)}
+    if name not in columns:
+        field = model._meta.fields[name]
+        migrate(SqliteMigrator(sql_database).add_column(table, name, field))
+
+
+def add_file_column(name):
+    add_column(File, name)
+
+
+def add_filename_column():
+    add_file_column("filename")
+
+
+def adopt_legacy_uploads():
+    """Hardlink files from the old flat `uploads` layout into the content-addressed store"""
+    # Migrations only use the columns which existed when they were written
+    query = File.select(File.id, File.filepath, File.sha256).where(
+        File.filename.is_null()
+    )
+    for obj in query:
+        target = blob_path(obj.sha256)
+        if Path(obj.filepath) != target:
+            add_blob(Path(obj.filepath), obj.sha256, link=True)
+        File.update(filename=Path(obj.filepath).name, filepath=str(target)).where(
+            File.id == obj.id
+        ).execute()
+
+
+def backfill_dependencies():
+    """Fill `Dependency` for files uploaded before it existed"""
+    query = (
+        File.select(File.id, File.depends)
+        .join(Dependency, JOIN.LEFT_OUTER)
+        .where(Dependency.id.is_null())
+    )
+    for obj in query:
+        add_dependencies(obj)
+
+
+def add_indexes():
+    for model in MODELS:
+        model._schema.create_indexes(safe=True)
+
+
+def compact_json():
+    """Rewrite `File.depends` without the whitespace of the old `indent=2` format"""
+    sql_database.execute_sql("UPDATE file SET depends = json(depends)")
+
+
+def build_search_index():
+    """Add existing files to `FileIndex`"""
+    for obj in File.select(File.id, File.filepath, File.description):
+        try:
+            document = search_document(Datapackage(obj.filepath, lazy=True))
+        except Exception:
+            # Index what we know about packages which can't be read
+            document = {"description": obj.description}
+        index_file(obj, document)
+
+
+def add_base_column():
+    add_file_column("base")
+
+
+def add_job_worker_columns():
+    add_column(UploadJob, "path")
+    add_column(UploadJob, "worker")
+
+
+# Append only; the position of each migration is its schema version, which is
+# stored in the database as `PRAGMA user_version`
+MIGRATIONS = [
+    add_filename_column,
+    adopt_legacy_uploads,
+    backfill_dependencies,
+    add_indexes,
+    compact_json,
+    build_search_index,
+    add_base_column,
+    add_job_worker_columns,
+]
+
+
+def schema_version() -> int:
+    return sql_database.pragma("user_version")
+
+
+def migrate_database():
+    """Create missing tables and apply any migrations not yet run on this database.
+
+    New databases are created with the current schema, and so start at the
+    latest version."""
+    new = not sql_database.table_exists(File._meta.table_name)
+    sql_database.create_tables(MODELS, safe=True)
+    if new:
+        sql_database.pragma("user_version", len(MIGRATIONS))
+        return
+
+    current = schema_version()
+    for version, func in enumerate(MIGRATIONS[current:], current + 1):
+        print(f"Migrating database to version {version}: {func.__name__}")
+        with sql_database.atomic():
+            func()
+            sql_database.pragma("user_version", version)
@@ -0,0 +1,74 @@
+from typing import Optional, Tuple
+
+from peewee import SQL
+
+from ..datapackage import Datapackage
+from .db import File, FileIndex
+
+# Node columns added to the index, when present
+NODE_FIELDS = ("name", "location", "categories")
+# Ranking weights for the `name`, `description`, `licenses` and `nodes` columns
+WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+
+
+def search_document(dp: Datapackage, chunk_size: int = 10_000) -> dict:
+    """Searchable text for a datapackage, as field values of `FileIndex`.
+
+    Reads only the indexed node columns, `chunk_size` rows at a time, so call
+    after `Datapackage.validate`."""
+    licenses = [
+        str(value)
+        for license in dp.metadata.get("licenses", [])
+        for key, value in license.items()
+        if key in ("name", "title")
+    ]
+    fields = {field["name"] for field in dp.nodes_resource["schema"]["fields"]}
+    columns = [field for field in NODE_FIELDS if field in fields]
+    # Unique values of each column, in order of first appearance
+    values = {field: {} for field in columns}
+    if columns:
+        index = dp.resources.index(dp.nodes_resource)
+        for chunk in dp.chunks(index, chunk_size, columns):
+            for field in columns:
+                values[field].update(dict.fromkeys(chunk[field].dropna().astype(str)))
+    values = dict.fromkeys(value for field in columns for value in values[field])
+    return {
+        "name": dp.name or "",
+        "description": dp.description or "",
+        "licenses": "\n".join(licenses),
+        "nodes": "\n".join(value for value in values if value),
+    }
+
+
+def index_file(obj: File, document: dict) -> None:
+    FileIndex.insert(rowid=obj.id, **document).on_conflict_replace().execute()
+
+
+def search_files(
+    q: str, limit: Optional[int] = None, offset: int = 0
+) -> Tuple[list, int]:
+    """Files matching FTS5 query `q`, best match first, and the total number of matches"""
+    query = (
+        File.select(
+            File.filename,
+            File.database,
+            File.sha256,
+            File.description,
+            FileIndex.bm25(*WEIGHTS).alias("score"),
+        )
+        .join(FileIndex, on=(FileIndex.rowid == File.id))
+        .where(FileIndex.match(FileIndex.clean_query(q)))
+    )
+    total = query.count()
+    query = query.order_by(SQL("score"), File.id).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return [
+        {
+            "filename": obj.filename,
+            "database": obj.database,
+            "sha256": obj.sha256,
+            "description": obj.description,
+        }
+        for obj in query
+    ], total
@@ -0,0 +1,122 @@
+import datetime
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from flask import abort
+
+from .db import UploadSession
+from .filesystem import staging_dir
+from .uploads import HashingFile
+
+
+def session_dir(session: UploadSession) -> Path:
+    return staging_dir / f"session-{session.id}"
+
+
+def chunk_count(session: UploadSession) -> int:
+    return max(-(-session.size // session.chunk_size), 1)
+
+
+def chunk_size(session: UploadSession, index: int) -> int:
+    if index == chunk_count(session) - 1:
+        return session.size - index * session.chunk_size
+    return session.chunk_size
+
+
+def received_chunks(session: UploadSession, dirpath: Optional[Path] = None) -> list:
+    dirpath = dirpath or session_dir(session)
+    if not dirpath.is_dir():
+        return []
+    return sorted(int(path.name) for path in dirpath.iterdir() if path.name.isdigit())
+
+
+def write_chunk(session: UploadSession, index: int, stream, blocksize=65536) -> None:
+    """Write chunk `index` of `session` from `stream`.
+
+    The chunk is only kept if it has the expected size, and replaces any
+    earlier copy atomically, so failed chunks can be sent again, even while
+    an earlier attempt is still being received."""
+    if not 0 <= index < chunk_count(session):
+        abort(404, "No such chunk")
+    expected = chunk_size(session, index)
+
+    dirpath = session_dir(session)
+    dirpath.mkdir(exist_ok=True)
+    tmp = dirpath / f".{index}.{uuid.uuid4().hex}.part"
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            while True:
+                buf = stream.read(blocksize)
+                if not buf:
+                    break
+                size += len(buf)
+                if size > expected:
+                    break
+                f.write(buf)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if size != expected:
+        tmp.unlink()
+        abort(400, f"Chunk {index} must be {expected} bytes")
+    tmp.replace(dirpath / str(index))
+
+
+def claim_chunks(session: UploadSession) -> Path:
+    """Move the chunks of `session` aside, so that only one request finishes it.
+
+    Aborts if another request already claimed them."""
+    claimed = staging_dir / f"session-{session.id}.{uuid.uuid4().hex}.finishing"
+    try:
+        session_dir(session).rename(claimed)
+    except FileNotFoundError:
+        abort(409, "This upload session is already being finished")
+    return claimed
+
+
+def release_chunks(session: UploadSession, claimed: Path) -> None:
+    """Return claimed chunks to `session`, so it can be finished again.
+
+    Chunks sent again in the meantime are kept."""
+    dirpath = session_dir(session)
+    dirpath.mkdir(exist_ok=True)
+    for path in claimed.iterdir():
+        if path.name.isdigit() and not (dirpath / path.name).exists():
+            path.replace(dirpath / path.name)
+    shutil.rmtree(claimed, ignore_errors=True)
+
+
+def assemble(session: UploadSession, dirpath: Path) -> HashingFile:
+    """Concatenate the chunks of `session` in `dirpath` into one staged file,
+    hashing it on the way"""
+    staged = HashingFile()
+    try:
+        for index in range(chunk_count(session)):
+            with open(dirpath / str(index), "rb") as f:
+                shutil.copyfileobj(f, staged)
+    except BaseException:
+        staged.discard()
+        raise
+    staged.close()
+    return staged
+
+
+def remove_session(session: UploadSession, claimed: Optional[Path] = None) -> None:
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    if claimed is not None:
+        shutil.rmtree(claimed, ignore_errors=True)
+    session.delete_instance()
+
+
+def expire_sessions(days: float) -> None:
+    """Remove sessions not finished within `days`, and chunks left by requests
+    which stopped while finishing a session"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    for session in UploadSession.select().where(UploadSession.created < cutoff):
+        remove_session(session)
+    for dirpath in staging_dir.glob("session-*.finishing"):
+        if dirpath.stat().st_mtime < cutoff.timestamp():
+            shutil.rmtree(dirpath, ignore_errors=True)
@@ -0,0 +1,92 @@
+import atexit
+import datetime
+import threading
+
+from peewee import Case, Value
+
+from .cache import index_cache
+from .db import File, sql_database
+
+
+class DownloadCounter:
+    """Buffer download counts in memory and write them to the database in batches.
+
+    Downloads only take a lock and update a dictionary; the buffered counts
+    are added to `File.count` (and `File.accessed` is updated) by `flush`,
+    which runs `interval` seconds after the first unflushed download and at
+    interpreter exit. If writing fails, the counts are kept for the next flush."""
+
+    # Each hash is used three times in the `UPDATE` statement; keep well below
+    # SQLite's limit on the number of query parameters
+    batch_size = 250
+
+    def __init__(self, interval: float = 30):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _schedule(self) -> None:
+        # Called with `_lock` held
+        if self._timer is None:
+            self._timer = threading.Timer(self.interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def record(self, sha256: str) -> None:
+        with self._lock:
+            count, _ = self._pending.get(sha256, (0, None))
+            self._pending[sha256] = (count + 1, datetime.datetime.now())
+            self._schedule()
+
+    def _restore(self, pending: dict) -> None:
+        with self._lock:
+            for key, (count, accessed) in pending.items():
+                current, latest = self._pending.get(key, (0, accessed))
+                self._pending[key] = (count + current, max(accessed, latest))
+            self._schedule()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return
+
+        items = sorted(pending.items())
+        try:
+            with sql_database.atomic():
+                for i in range(0, len(items), self.batch_size):
+                    batch = items[i : i + self.batch_size]
+                    # Without `converter=False`, peewee converts the hashes
+                    # with the `count` field, turning all-digit hashes into ints
+                    File.update(
+                        count=File.count
+                        + Case(
+                            File.sha256,
+                            [
+                                (Value(key, converter=False), count)
+                                for key, (count, _) in batch
+                            ],
+                            0,
+                        ),
+                        accessed=Case(
+                            File.sha256,
+                            [(key, str(accessed)) for key, (_, accessed) in batch],
+                            File.accessed,
+                        ),
+                    ).where(File.sha256.in_([key for key, _ in batch])).execute()
+        except Exception:
+            # Keep the counts (e.g. if the database is locked); they are
+            # written by the next flush
+            self._restore(pending)
+            raise
+
+        index_cache.add_changes(sum(count for count, _ in pending.values()))
+
+
+download_counter = DownloadCounter()
+atexit.register(download_counter.flush)
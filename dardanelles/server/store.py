@@ -0,0 +1,97 @@
+import json
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import Iterable
+
+from .filesystem import data_dir
+
+uploads_dir = data_dir / "uploads"
+
+HASH_RE = re.compile("^[0-9a-f]{64}$")
+
+
+def valid_hash(sha256: str) -> bool:
+    return bool(HASH_RE.match(sha256))
+
+
+def blob_path(sha256: str) -> Path:
+    """Location of the datapackage with hash `sha256`, e.g. `uploads/ab/cd/abcd...zip`.
+
+    Files are sharded by the first two bytes of their hash so that no single
+    directory grows too large."""
+    if not valid_hash(sha256):
+        raise ValueError(f"Invalid hash {sha256}")
+    return uploads_dir / sha256[:2] / sha256[2:4] / f"{sha256}.zip"
+
+
+def sidecar_path(sha256: str, kind: str, suffix: str = "json") -> Path:
+    """Location of derived data for a datapackage, e.g. `uploads/ab/cd/abcd....summary.json`"""
+    return blob_path(sha256).with_suffix(f".{kind}.{suffix}")
+
+
+def add_sidecar(sha256: str, kind: str, data) -> Path:
+    """Atomically write `data` as JSON to the `kind` sidecar of `sha256`"""
+    target = sidecar_path(sha256, kind)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, target)
+    return target
+
+
+def add_sidecar_lines(sha256: str, kind: str, records: Iterable) -> Path:
+    """Atomically write `records` as JSON lines to the `kind` sidecar of `sha256`.
+
+    Records are written as they are generated, and can be read back one line
+    at a time."""
+    target = sidecar_path(sha256, kind, "jsonl")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return target
+
+
+def add_blob(filepath: Path, sha256: str, link: bool = False) -> Path:
+    """Add the file at `filepath` to the store under `sha256`.
+
+    By default `filepath` is moved into place with an atomic rename. With
+    `link`, `filepath` is left where it is and hardlinked into the store
+    (copied if hardlinks aren't supported). If the hash is already stored,
+    the existing file is kept and, unless linking, `filepath` is deleted."""
+    target = blob_path(sha256)
+    if target.exists():
+        if not link:
+            Path(filepath).unlink()
+        return target
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if link:
+        tmp = target.with_name(f".{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(filepath, tmp)
+        except OSError:
+            shutil.copyfile(filepath, tmp)
+        os.replace(tmp, target)
+    else:
+        os.replace(filepath, target)
+    return target
+
+
+def remove_blob(sha256: str) -> None:
+    target = blob_path(sha256)
+    if target.exists():
+        target.unlink()
+    # Sidecars and materialised packages
+    for derived in target.parent.glob(f"{sha256}.*"):
+        derived.unlink()
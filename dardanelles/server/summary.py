@@ -0,0 +1,106 @@
+import functools
+import itertools
+import json
+from typing import Iterator
+
+from ..datapackage import Datapackage
+from .metrics import cache_requests, lru_cache_counts
+from .store import add_sidecar, add_sidecar_lines, blob_path, sidecar_path
+
+# Node columns included in the node listing, when present
+NODE_LISTING_FIELDS = (
+    "id",
+    "database",
+    "code",
+    "name",
+    "reference product",
+    "location",
+    "unit",
+    "type",
+    "categories",
+)
+# Rows read at a time from nodes and edges tables
+CHUNK_SIZE = 10_000
+
+
+def build_summary(dp: Datapackage, counts: dict, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Compact description of a datapackage.
+
+    `counts` are the row counts returned by `Datapackage.validate`."""
+    edge_fields = [field["name"] for field in dp.edges_resource["schema"]["fields"]]
+    source_databases = set()
+    if "source_database" in edge_fields:
+        index = dp.resources.index(dp.edges_resource)
+        for chunk in dp.chunks(index, chunk_size, ["source_database"]):
+            source_databases.update(chunk["source_database"].dropna().astype(str))
+
+    return {
+        "name": dp.name,
+        "database": dp.database,
+        "description": dp.description,
+        "depends": dp.depends,
+        # Hash of the base package, if this is a delta
+        "base": dp.metadata.get("base"),
+        "licenses": dp.metadata.get("licenses", []),
+        "nodes": counts[dp.nodes_resource["path"]],
+        "edges": counts[dp.edges_resource["path"]],
+        "source_databases": sorted(source_databases),
+        "resources": [
+            {
+                "path": resource["path"],
+                "mediatype": resource["mediatype"],
+                "rows": counts[resource["path"]],
+                "fields": resource.get("schema", {}).get("fields", []),
+            }
+            for resource in dp.resources
+        ],
+    }
+
+
+def node_listing(dp: Datapackage, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """Generate the listing of each node in `dp`, without missing values"""
+    fields = {field["name"] for field in dp.nodes_resource["schema"]["fields"]}
+    columns = [label for label in NODE_LISTING_FIELDS if label in fields]
+    index = dp.resources.index(dp.nodes_resource)
+    for chunk in dp.chunks(index, chunk_size, columns):
+        # `to_json` converts Numpy types and missing values
+        for record in json.loads(chunk.to_json(orient="records")):
+            yield {
+                key: value for key, value in record.items() if value not in (None, "")
+            }
+
+
+def add_summary(sha256: str, dp: Datapackage, summary: dict) -> None:
+    """Write the summary and node listing sidecars of `dp`.
+
+    The summary is written last, so that if it exists, so does the listing."""
+    add_sidecar_lines(sha256, "nodes", node_listing(dp))
+    add_sidecar(sha256, "summary", summary)
+
+
+def ensure_sidecars(sha256: str) -> None:
+    """Compute the sidecars of packages uploaded before they existed"""
+    if not sidecar_path(sha256, "summary").exists():
+        dp = Datapackage(blob_path(sha256), lazy=True)
+        add_summary(sha256, dp, build_summary(dp, dp.validate()))
+
+
+@functools.lru_cache(maxsize=256)
+def load_summary(sha256: str) -> dict:
+    """Summary of the stored package `sha256`"""
+    ensure_sidecars(sha256)
+    with open(sidecar_path(sha256, "summary"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_nodes(sha256: str, offset: int, limit: int) -> list:
+    """Listing of nodes `offset` to `offset + limit` of the stored package
+    `sha256`, reading only as far into the listing as needed"""
+    ensure_sidecars(sha256)
+    with open(sidecar_path(sha256, "nodes", "jsonl"), encoding="utf-8") as f:
+        return [
+            json.loads(line) for line in itertools.islice(f, offset, offset + limit)
+        ]
+
+
+cache_requests.add_callback(lru_cache_counts("summary", load_summary))
@@ -0,0 +1,78 @@
+import hashlib
+import tempfile
+import time
+from pathlib import Path
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from .filesystem import staging_dir
+
+
+class HashingFile:
+    """Writable temporary file which computes SHA 256 hash and size as data arrives.
+
+    Used as the target for multipart file uploads, so the request body is written
+    to disk and hashed in a single pass. Time spent hashing and writing is
+    kept in `hash_seconds` and `write_seconds`."""
+
+    def __init__(self, dirpath: Path = staging_dir, max_size: int = None):
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+        self.hash_seconds = self.write_seconds = 0.0
+        self._fo = tempfile.NamedTemporaryFile(
+            dir=dirpath, suffix=".part", delete=False
+        )
+        self.path = Path(self._fo.name)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise RequestEntityTooLarge
+        start = time.perf_counter()
+        self.hasher.update(data)
+        hashed = time.perf_counter()
+        written = self._fo.write(data)
+        self.hash_seconds += hashed - start
+        self.write_seconds += time.perf_counter() - hashed
+        return written
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+    def discard(self):
+        self._fo.close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def __getattr__(self, name):
+        return getattr(self._fo, name)
+
+
+class UploadRequest(Request):
+    """Request class which streams uploaded files through `HashingFile`.
+
+    Any `HashingFile` whose data wasn't moved elsewhere during the request is
+    deleted in `cleanup_staged_files`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.staged_files = []
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        obj = HashingFile(max_size=current_app.config["MAX_PACKAGE_SIZE"])
+        self.staged_files.append(obj)
+        return obj
+
+
+def keep_staged_file(request, obj):
+    """Keep `obj` after the request ends; the caller becomes responsible for it"""
+    request.staged_files.remove(obj)
+
+
+def cleanup_staged_files(request):
+    for obj in getattr(request, "staged_files", []):
+        obj.discard()
@@ -0,0 +1,210 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# Keep test projects, and the server and client data directories, out of the
+# user's directories; must be set before `bw2data` or `dardanelles.server` are
+# imported, as they create their directories on import
+_root = tempfile.mkdtemp(prefix="dardanelles-tests-")
+os.environ["BRIGHTWAY_DIR"] = os.path.join(_root, "brightway")
+for _name in ("XDG_DATA_HOME", "XDG_CACHE_HOME", "XDG_STATE_HOME"):
+    os.environ[_name] = os.path.join(_root, _name.lower())
+os.makedirs(os.environ["XDG_DATA_HOME"])
+
+import pytest  # noqa: E402
+import requests  # noqa: E402
+from requests.structures import CaseInsensitiveDict  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures"
+MOBILITY = FIXTURES / "Mobility-example.dfecf5bd.zip"
+
+
+def foreground_data(amount: float = 0.5, nodes: int = 20) -> dict:
+    """Foreground processes, each with a production exchange, inputs from two
+    other processes, and a biosphere exchange from another database"""
+    return {
+        ("foreground", f"p{i}"): {
+            "name": f"process {i}",
+            "reference product": f"product {i}",
+            "location": "GLO",
+            "unit": "kilogram",
+            "type": "process",
+            "exchanges": [
+                {"input": ("foreground", f"p{i}"), "amount": 1, "type": "production"},
+                {
+                    "input": ("foreground", f"p{(i + 1) % nodes}"),
+                    "amount": amount if i == 0 else 0.5,
+                    "type": "technosphere",
+                },
+                {
+                    "input": ("foreground", f"p{(i + 2) % nodes}"),
+                    "amount": 0.25,
+                    "type": "technosphere",
+                },
+                {"input": ("biosphere", "co2"), "amount": 2.0, "type": "biosphere"},
+            ],
+        }
+        for i in range(nodes)
+    }
+
+
+@pytest.fixture
+def project():
+    bd = pytest.importorskip("bw2data")
+    bd.projects.set_current("dardanelles-tests")
+    for name in list(bd.databases):
+        del bd.databases[name]
+    bd.Database("biosphere").write(
+        {
+            ("biosphere", "co2"): {
+                "name": "Carbon dioxide",
+                "unit": "kilogram",
+                "type": "emission",
+                "categories": ("air",),
+            }
+        }
+    )
+    bd.Database("foreground").write(foreground_data())
+    return bd
+
+
+@pytest.fixture
+def app():
+    """The server app, with an empty database, store and caches"""
+    pytest.importorskip("flask")
+    from dardanelles.server import dardanelles_app
+    from dardanelles.server import db
+    from dardanelles.server.cache import catalog_cache, index_cache
+    from dardanelles.server.filesystem import staging_dir
+    from dardanelles.server.stats import download_counter
+    from dardanelles.server.store import uploads_dir
+    from dardanelles.server.summary import load_summary
+
+    download_counter.flush()
+    for model in (
+        db.UploadJob,
+        db.UploadSession,
+        db.FileIndex,
+        db.Dependency,
+        db.File,
+        db.User,
+    ):
+        model.delete().execute()
+    shutil.rmtree(uploads_dir)
+    uploads_dir.mkdir()
+    # Keep the lock file of the running `UploadQueue`
+    for path in staging_dir.iterdir():
+        if path.suffix != ".lock":
+            shutil.rmtree(path) if path.is_dir() else path.unlink()
+    catalog_cache.invalidate()
+    index_cache.invalidate()
+    load_summary.cache_clear()
+    return dardanelles_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    from dardanelles.server.db import User
+
+    return User.create(name="alice", api_key="alice-key", email_hash="alice")
+
+
+def make_package(dirpath, filename="mobility.zip", **metadata):
+    """Write the Mobility example datapackage with changed ``metadata`` to
+    ``dirpath / filename``; returns its path and hash"""
+    from dardanelles.client.utils import sha256
+
+    filepath = Path(dirpath) / filename
+    with zipfile.ZipFile(MOBILITY) as source:
+        data = json.loads(source.read("datapackage.json"))
+        data.update(
+            {
+                "database": "Mobility example",
+                "description": "Mobility example",
+                "depends": [],
+                **metadata,
+            }
+        )
+        with zipfile.ZipFile(filepath, "w", zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                if info.filename != "datapackage.json":
+                    target.writestr(info, source.read(info))
+            target.writestr("datapackage.json", json.dumps(data))
+    return filepath, sha256(filepath)
+
+
+@pytest.fixture
+def mobility(tmp_path):
+    """The Mobility example datapackage, and its hash"""
+    return make_package(tmp_path)
+
+
+def upload(client, filepath, sha256, api_key="alice-key", **fields):
+    with open(filepath, "rb") as f:
+        return client.post(
+            "/upload",
+            data={
+                "sha256": sha256,
+                "database": "Mobility example",
+                "filename": Path(filepath).name,
+                "api_key": api_key,
+                "file": (f, Path(filepath).name),
+                **fields,
+            },
+        )
+
+
+class FlaskAdapter(requests.adapters.BaseAdapter):
+    """Send requests of a ``requests.Session`` to a Flask test client"""
+
+    def __init__(self, app):
+        super().__init__()
+        self.client = app.test_client()
+
+    def send(self, request, stream=False, **kwargs):
+        url = urlsplit(request.url)
+        body = request.body
+        if hasattr(body, "read"):
+            body = body.read()
+        resp = self.client.open(
+            url.path,
+            method=request.method,
+            query_string=url.query,
+            headers=dict(request.headers),
+            data=body,
+        )
+        response = requests.Response()
+        response.status_code = resp.status_code
+        response.reason = resp.status.split(" ", 1)[-1]
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.raw = io.BytesIO(resp.get_data())
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def remote(app, user, tmp_path):
+    """``DardanellesClient`` connected to the test server"""
+    from dardanelles.client.cache import DownloadCache
+    from dardanelles.client.client import DardanellesClient
+
+    url = "http://dardanelles.test"
+    remote = DardanellesClient(
+        "alice-key", url=url, cache=DownloadCache(tmp_path / "cache")
+    )
+    remote.session.mount(url, FlaskAdapter(app))
+    return remote
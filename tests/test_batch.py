@@ -0,0 +1,88 @@
+import io
+import tarfile
+
+from conftest import make_package, upload
+
+from dardanelles.server import dardanelles_app
+from dardanelles.server.db import File
+
+
+def test_upload_batch(client, user, tmp_path):
+    first, first_hash = make_package(tmp_path, "first.zip", description="first")
+    second, second_hash = make_package(tmp_path, "second.zip", description="second")
+    upload(client, first, first_hash)
+
+    with open(first, "rb") as f1, open(second, "rb") as f2, open(second, "rb") as f3:
+        resp = client.post(
+            "/upload/batch",
+            data={
+                "api_key": "alice-key",
+                "sha256": [first_hash, second_hash, "0" * 64],
+                "database": ["Mobility example"] * 3,
+                "filename": ["first.zip", "second.zip", "third.zip"],
+                "file": [(f1, "first.zip"), (f2, "second.zip"), (f3, "third.zip")],
+            },
+        )
+    assert resp.status_code == 200
+    assert [result["status"] for result in resp.json] == [409, 200, 406]
+    assert resp.json[1]["sha256"] == second_hash
+    assert File.select().count() == 2
+
+
+def test_upload_batch_mismatched_fields(client, user, mobility):
+    filepath, sha256 = mobility
+    with open(filepath, "rb") as f:
+        resp = client.post(
+            "/upload/batch",
+            data={
+                "api_key": "alice-key",
+                "sha256": [sha256, sha256],
+                "database": ["Mobility example"],
+                "filename": ["mobility.zip"],
+                "file": [(f, "mobility.zip")],
+            },
+        )
+    assert resp.status_code == 400
+
+
+def test_download_batch(client, user, tmp_path):
+    hashes = {}
+    for name in ("a", "b"):
+        filepath, sha256 = make_package(tmp_path, f"{name}.zip", description=name)
+        upload(client, filepath, sha256)
+        hashes[sha256] = filepath.read_bytes()
+
+    resp = client.post("/download/batch", data={"sha256": list(hashes)})
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-tar"
+    with tarfile.open(fileobj=io.BytesIO(resp.data)) as archive:
+        assert {
+            member.name: archive.extractfile(member).read() for member in archive
+        } == {f"{sha256}.zip": content for sha256, content in hashes.items()}
+
+
+def test_download_batch_errors(client, user, mobility, monkeypatch):
+    filepath, sha256 = mobility
+    upload(client, filepath, sha256)
+
+    assert client.post("/download/batch").status_code == 400
+    resp = client.post("/download/batch", data={"sha256": [sha256, "0" * 64]})
+    assert resp.status_code == 404
+    assert "0" * 64 in resp.get_data(as_text=True)
+    monkeypatch.setitem(dardanelles_app.config, "MAX_BATCH_SIZE", 1)
+    resp = client.post("/download/batch", data={"sha256": [sha256, "0" * 64]})
+    assert resp.status_code == 413
+
+
+def test_client_batches(remote, user, tmp_path):
+    filepaths = [
+        make_package(tmp_path, f"{name}.zip", description=name)[0] for name in "abc"
+    ]
+    results = remote.upload_many(filepaths, batch_size=2)
+    assert [result["status"] for result in results] == [200, 200, 200]
+
+    hashes = [result["sha256"] for result in results]
+    paths = remote.download_many(hashes, batch_size=2)
+    assert set(paths) == set(hashes)
+    for filepath, sha256 in zip(filepaths, hashes):
+        assert paths[sha256].read_bytes() == filepath.read_bytes()
@@ -0,0 +1,71 @@
+from conftest import make_package, upload
+
+
+def upload_packages(client, tmp_path, count=3):
+    hashes = []
+    for i in range(count):
+        filepath, sha256 = make_package(
+            tmp_path, f"package-{i}.zip", database=f"db-{i}", depends=["biosphere3"]
+        )
+        resp = upload(client, filepath, sha256, database=f"db-{i}")
+        assert resp.status_code == 200
+        hashes.append(sha256)
+    return hashes
+
+
+def test_catalog_filters_and_pages(client, user, tmp_path):
+    hashes = upload_packages(client, tmp_path)
+
+    resp = client.get("/catalog")
+    assert [row[2] for row in resp.get_json()] == hashes
+    assert resp.headers["X-Total-Count"] == "3"
+
+    resp = client.get("/catalog?limit=1&offset=1")
+    assert [row[2] for row in resp.get_json()] == hashes[1:2]
+    assert resp.headers["X-Total-Count"] == "3"
+
+    assert [row[2] for row in client.get("/catalog?database=db-2").get_json()] == [
+        hashes[2]
+    ]
+    assert len(client.get("/catalog?user=alice").get_json()) == 3
+    assert client.get("/catalog?user=bob").get_json() == []
+    assert len(client.get("/catalog?depends=biosphere3").get_json()) == 3
+    assert client.get("/catalog?limit=x").status_code == 400
+    assert client.get("/catalog?offset=-1").status_code == 400
+
+
+def test_catalog_etag(client, user, tmp_path):
+    upload_packages(client, tmp_path, count=1)
+    resp = client.get("/catalog")
+    etag = resp.headers["ETag"]
+
+    resp = client.get("/catalog", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    # Changes to the catalog change the ETag
+    filepath, sha256 = make_package(tmp_path, "new.zip", database="new")
+    assert upload(client, filepath, sha256).status_code == 200
+    resp = client.get("/catalog", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert len(resp.get_json()) == 2
+
+
+def test_client_catalog_cache(remote, client, tmp_path):
+    hashes = upload_packages(client, tmp_path)
+    remote.catalog_cache_size = 2
+
+    assert [row[2] for row in remote.iter_catalog(page_size=1)] == hashes
+    # One entry per page, including the last, empty one
+    assert len(remote._catalog_cache) == 2
+    assert list(remote._catalog_cache) == [
+        (("limit", 1), ("offset", 2)),
+        (("limit", 1), ("offset", 3)),
+    ]
+
+    # Revalidated responses are served from the cache
+    statuses = []
+    remote.session.hooks["response"].append(
+        lambda resp, *args, **kwargs: statuses.append(resp.status_code)
+    )
+    assert remote.catalog(limit=1, offset=2)[0][2] == hashes[2]
+    assert statuses == [304]
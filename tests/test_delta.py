@@ -0,0 +1,96 @@
+import pandas as pd
+from conftest import foreground_data
+
+from dardanelles.client.export_df import to_dardanelles_datapackage
+from dardanelles.datapackage import Datapackage
+from dardanelles.delta import (
+    EDGE_ID_COLUMNS,
+    EDGE_KEY,
+    NODE_ID_COLUMNS,
+    NODE_KEY,
+    apply_delta,
+    create_delta,
+)
+
+
+def export(directory):
+    directory.mkdir()
+    filepath = to_dardanelles_datapackage(
+        "foreground", author="tests", description="", directory=directory
+    )
+    return Datapackage(filepath)
+
+
+def without_ids(df, id_columns, key):
+    return (
+        df.drop(columns=list(id_columns))
+        .sort_values(list(key) + ["edge_amount"] if "edge_amount" in df else list(key))
+        .reset_index(drop=True)
+    )
+
+
+def test_delta_of_rewritten_database(project, tmp_path):
+    base = export(tmp_path / "base")
+    old_ids = set(base.nodes["id"])
+
+    # Writing the database again assigns new ids
+    project.Database("foreground").write(foreground_data(amount=0.75))
+    new = export(tmp_path / "new")
+    assert old_ids.isdisjoint(new.nodes["id"])
+
+    delta = Datapackage(create_delta(base, new, "0" * 64, tmp_path))
+    assert len(delta.nodes) == 0
+    assert len(delta.edges) == 1
+    assert delta.edges["edge_amount"].tolist() == [0.75]
+    assert delta.metadata["removed"] == {"nodes": [], "edges": []}
+
+    full = Datapackage(apply_delta(base, delta, tmp_path / "base"))
+    pd.testing.assert_frame_equal(
+        without_ids(full.nodes, NODE_ID_COLUMNS, NODE_KEY),
+        without_ids(new.nodes, NODE_ID_COLUMNS, NODE_KEY),
+    )
+    pd.testing.assert_frame_equal(
+        without_ids(full.edges, EDGE_ID_COLUMNS, EDGE_KEY),
+        without_ids(new.edges, EDGE_ID_COLUMNS, EDGE_KEY),
+    )
+
+    # Edges point to the nodes with the same key in the patched package
+    ids = dict(zip(zip(full.nodes["database"], full.nodes["code"]), full.nodes["id"]))
+    targets = zip(full.edges["target_database"], full.edges["target_code"])
+    assert [ids[key] for key in targets] == full.edges["target_id"].tolist()
+
+
+def test_delta_with_added_and_removed_nodes(project, tmp_path):
+    base = export(tmp_path / "base")
+
+    data = foreground_data()
+    del data[("foreground", "p19")]
+    for ds in data.values():
+        ds["exchanges"] = [
+            exc for exc in ds["exchanges"] if exc["input"] != ("foreground", "p19")
+        ]
+    data[("foreground", "new")] = {
+        "name": "new process",
+        "unit": "kilogram",
+        "location": "GLO",
+        "type": "process",
+        "exchanges": [
+            {"input": ("foreground", "new"), "amount": 1, "type": "production"}
+        ],
+    }
+    project.Database("foreground").write(data)
+    new = export(tmp_path / "new")
+
+    delta = Datapackage(create_delta(base, new, "0" * 64, tmp_path))
+    assert delta.metadata["removed"]["nodes"] == [["foreground", "p19"]]
+    assert ["foreground", "p19", "foreground", "p19", "production"] in (
+        delta.metadata["removed"]["edges"]
+    )
+
+    full = Datapackage(apply_delta(base, delta, tmp_path / "base"))
+    assert len(full.nodes) == len(new.nodes)
+    assert full.nodes["id"].is_unique
+    pd.testing.assert_frame_equal(
+        without_ids(full.edges, EDGE_ID_COLUMNS, EDGE_KEY),
+        without_ids(new.edges, EDGE_ID_COLUMNS, EDGE_KEY),
+    )
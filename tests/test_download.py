@@ -0,0 +1,131 @@
+import pytest
+from conftest import upload
+from peewee import OperationalError
+
+from dardanelles.server import stats
+from dardanelles.server.db import File
+from dardanelles.server.stats import DownloadCounter, download_counter
+
+
+@pytest.fixture
+def stored(client, user, mobility):
+    filepath, sha256 = mobility
+    assert upload(client, filepath, sha256).status_code == 200
+    return filepath.read_bytes(), sha256
+
+
+def test_download(client, stored):
+    data, sha256 = stored
+    resp = client.get(f"/download/{sha256}")
+    assert resp.status_code == 200
+    assert resp.data == data
+    assert resp.headers["ETag"] == f'"{sha256}"'
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert "immutable" in resp.headers["Cache-Control"]
+    assert f"filename={sha256}.zip" in resp.headers["Content-Disposition"]
+
+    assert client.get(f"/download/{'0' * 64}").status_code == 404
+    assert client.get("/download/invalid").status_code == 404
+
+
+def test_download_not_modified(client, stored):
+    _, sha256 = stored
+    resp = client.get(f"/download/{sha256}", headers={"If-None-Match": f'"{sha256}"'})
+    assert resp.status_code == 304
+    assert not resp.data
+
+
+def test_download_range(client, stored):
+    data, sha256 = stored
+    resp = client.get(f"/download/{sha256}", headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.data == data[10:20]
+    assert resp.headers["Content-Range"] == f"bytes 10-19/{len(data)}"
+
+    resp = client.get(f"/download/{sha256}", headers={"Range": "bytes=100000-"})
+    assert resp.status_code == 416
+
+
+def test_download_if_range(client, stored):
+    data, sha256 = stored
+    resp = client.get(
+        f"/download/{sha256}",
+        headers={"Range": "bytes=10-", "If-Range": f'"{sha256}"'},
+    )
+    assert resp.status_code == 206
+    assert resp.data == data[10:]
+
+    # A different validator gets the whole file
+    resp = client.get(
+        f"/download/{sha256}", headers={"Range": "bytes=10-", "If-Range": '"other"'}
+    )
+    assert resp.status_code == 200
+    assert resp.data == data
+
+
+def test_download_accel_redirect(client, app, stored):
+    _, sha256 = stored
+    app.config["X_ACCEL_REDIRECT_PREFIX"] = "/protected/"
+    try:
+        resp = client.get(f"/download/{sha256}")
+        assert resp.headers["X-Accel-Redirect"] == (
+            f"/protected/{sha256[:2]}/{sha256[2:4]}/{sha256}.zip"
+        )
+        assert not resp.data
+        assert resp.headers["ETag"] == f'"{sha256}"'
+        resp = client.get(
+            f"/download/{sha256}", headers={"If-None-Match": f'"{sha256}"'}
+        )
+        assert resp.status_code == 304
+    finally:
+        app.config["X_ACCEL_REDIRECT_PREFIX"] = None
+
+
+def test_downloads_are_counted(client, stored):
+    _, sha256 = stored
+    client.get(f"/download/{sha256}")
+    client.get(f"/download/{sha256}")
+    # Revalidations and resumed downloads aren't counted
+    client.get(f"/download/{sha256}", headers={"If-None-Match": f'"{sha256}"'})
+    client.get(f"/download/{sha256}", headers={"Range": "bytes=10-"})
+
+    assert File.get(File.sha256 == sha256).count == 0
+    download_counter.flush()
+    assert File.get(File.sha256 == sha256).count == 2
+
+
+def test_counter_batches(app, user, monkeypatch):
+    hashes = [f"{i:064x}" for i in range(5)]
+    for sha256 in hashes:
+        File.create(
+            user=user, filepath="", sha256=sha256, database="db", description=""
+        )
+    counter = DownloadCounter(interval=3600)
+    monkeypatch.setattr(counter, "batch_size", 2)
+    for i, sha256 in enumerate(hashes):
+        for _ in range(i + 1):
+            counter.record(sha256)
+    assert counter._timer is not None
+
+    counter.flush()
+    assert counter._timer is None
+    counts = {obj.sha256: obj.count for obj in File.select()}
+    assert counts == {sha256: i + 1 for i, sha256 in enumerate(hashes)}
+
+
+def test_counter_keeps_counts_if_flush_fails(app, user, monkeypatch):
+    sha256 = "f" * 64
+    File.create(user=user, filepath="", sha256=sha256, database="db", description="")
+    counter = DownloadCounter(interval=3600)
+    counter.record(sha256)
+
+    def locked():
+        raise OperationalError("database is locked")
+
+    with monkeypatch.context() as m:
+        m.setattr(stats.sql_database, "atomic", locked)
+        with pytest.raises(OperationalError):
+            counter.flush()
+    counter.record(sha256)
+    counter.flush()
+    assert File.get(File.sha256 == sha256).count == 2
@@ -0,0 +1,46 @@
+import threading
+
+from dardanelles.client.export_df import (
+    EDGE_COLUMNS,
+    UNCERTAINTY_FIELDS,
+    prefetch,
+    to_dardanelles_datapackage,
+)
+from dardanelles.datapackage import Datapackage
+
+
+def test_export_database_without_exchanges(project, tmp_path):
+    filepath = to_dardanelles_datapackage(
+        "biosphere", author="tests", description="", directory=tmp_path
+    )
+    dp = Datapackage(filepath)
+
+    assert len(dp.nodes) == 1
+    assert len(dp.edges) == 0
+    assert list(dp.edges.columns) == list(EDGE_COLUMNS) + list(UNCERTAINTY_FIELDS)
+    fields = {
+        field["name"]: field["type"] for field in dp.edges_resource["schema"]["fields"]
+    }
+    assert fields["target_id"] == fields["edge_amount"] == "number"
+
+
+def test_prefetch_stops_when_consumer_fails():
+    produced = []
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    before = set(threading.enumerate())
+    chunks = prefetch(items(), size=2)
+    try:
+        for item in chunks:
+            raise RuntimeError
+    except RuntimeError:
+        chunks.close()
+    threads = set(threading.enumerate()) - before
+    for thread in threads:
+        thread.join(timeout=2)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(produced) < 10
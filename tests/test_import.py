@@ -0,0 +1,68 @@
+import pytest
+from conftest import foreground_data
+
+from dardanelles.client import export_df
+from dardanelles.client.convert import datapackage_to_data
+from dardanelles.client.export_df import to_dardanelles_datapackage
+from dardanelles.client.import_class import DardanellesStreamingImporter
+from dardanelles.datapackage import Datapackage
+
+
+@pytest.fixture
+def package(project, tmp_path):
+    filepath = to_dardanelles_datapackage(
+        "foreground", author="tests", description="", directory=tmp_path
+    )
+    return Datapackage(filepath, lazy=True)
+
+
+@pytest.fixture(params=["current", "legacy"])
+def biosphere_package(request, project, tmp_path, monkeypatch):
+    """Package of a database without exchanges; legacy packages have only the
+    uncertainty columns in their edges table"""
+    if request.param == "legacy":
+        monkeypatch.setattr(export_df, "EDGE_COLUMNS", {})
+    filepath = to_dardanelles_datapackage(
+        "biosphere", author="tests", description="", directory=tmp_path
+    )
+    return Datapackage(filepath, lazy=True)
+
+
+def test_streaming_import_links_other_databases(project, package):
+    importer = DardanellesStreamingImporter(package, chunk_size=7, batch_size=3)
+    db = importer.write_database("imported")
+
+    assert len(db) == len(foreground_data())
+    node = project.get_node(database="imported", code="p0")
+    inputs = {exc["type"]: exc.input.key for exc in node.exchanges()}
+    assert inputs["production"] == ("imported", "p0")
+    assert inputs["biosphere"] == ("biosphere", "co2")
+    assert {exc.input.key for exc in node.technosphere()} == {
+        ("imported", "p1"),
+        ("imported", "p2"),
+    }
+
+
+def test_streaming_import_needs_other_databases(project, package):
+    del project.databases["biosphere"]
+    importer = DardanellesStreamingImporter(package)
+    with pytest.raises(ValueError, match="import its dependencies first"):
+        importer.write_database("imported")
+    assert len(project.Database("imported")) == 0
+
+
+def test_import_database_without_exchanges(project, biosphere_package):
+    data = datapackage_to_data(biosphere_package)
+    assert list(data) == [("biosphere", "co2")]
+    assert data[("biosphere", "co2")]["name"] == "Carbon dioxide"
+    assert data[("biosphere", "co2")]["exchanges"] == []
+
+
+def test_streaming_import_database_without_exchanges(project, biosphere_package):
+    importer = DardanellesStreamingImporter(biosphere_package)
+    db = importer.write_database("imported")
+
+    assert len(db) == 1
+    node = project.get_node(database="imported", code="co2")
+    assert node["name"] == "Carbon dioxide"
+    assert len(node.exchanges()) == 0
@@ -0,0 +1,81 @@
+from conftest import make_package, upload
+
+from dardanelles.server.cache import index_cache
+from dardanelles.server.db import File, sql_database
+
+
+def upload_packages(client, tmp_path, count):
+    for i in range(count):
+        filepath, sha256 = make_package(
+            tmp_path, f"package-{i}.zip", description=f"package {i}"
+        )
+        resp = upload(client, filepath, sha256, database=f"db-{i}")
+        assert resp.status_code == 200
+
+
+def test_index(client, user, tmp_path):
+    upload_packages(client, tmp_path, 3)
+    resp = client.get("/")
+    assert resp.status_code == 200
+    html = resp.get_data(as_text=True)
+    for i in range(3):
+        assert f"db-{i}" in html
+    assert "alice" in html
+
+
+def test_index_queries(client, user, tmp_path, monkeypatch):
+    upload_packages(client, tmp_path, 3)
+    statements = []
+    execute_sql = sql_database.execute_sql
+
+    def counting_execute_sql(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(sql_database, "execute_sql", counting_execute_sql)
+    client.get("/")
+    # Rows and their users in one query, and the page count; not one per row
+    assert len(statements) == 2
+
+    # Rendered pages are cached
+    statements.clear()
+    client.get("/")
+    assert statements == []
+
+
+def test_index_pages(client, app, user, tmp_path):
+    upload_packages(client, tmp_path, 3)
+    app.config["INDEX_PAGE_SIZE"] = 2
+    try:
+        first = client.get("/").get_data(as_text=True)
+        second = client.get("/?page=2").get_data(as_text=True)
+    finally:
+        app.config["INDEX_PAGE_SIZE"] = 100
+    assert "db-0" in first and "db-2" not in first
+    assert "db-2" in second and "db-0" not in second
+    assert "Page 2 of 2" in second
+
+
+def test_index_etag(client, user, tmp_path):
+    upload_packages(client, tmp_path, 1)
+    resp = client.get("/")
+    etag = resp.headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+    # New uploads change the page
+    filepath, sha256 = make_package(tmp_path, "new.zip", description="new")
+    assert upload(client, filepath, sha256, database="new").status_code == 200
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert "new" in resp.get_data(as_text=True)
+
+
+def test_index_cache_tolerates_download_counts(client, user, tmp_path):
+    upload_packages(client, tmp_path, 1)
+    etag = client.get("/").headers["ETag"]
+    File.update(count=5).execute()
+    # Download counts may lag, up to `change_threshold` downloads
+    index_cache.add_changes(index_cache.change_threshold)
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+    index_cache.add_changes(1)
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 200
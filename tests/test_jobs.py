@@ -0,0 +1,124 @@
+import datetime
+import time
+
+from conftest import upload
+
+from dardanelles.client.utils import sha256
+
+from dardanelles.server import jobs
+from dardanelles.server.db import File, UploadJob
+
+
+def wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = client.get(f"/upload/{job_id}").get_json()
+        if data["status"] not in UploadJob.PENDING:
+            return data
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} didn't finish")
+
+
+def test_async_upload_invalid(client, user, tmp_path):
+    filepath = tmp_path / "invalid.zip"
+    filepath.write_bytes(b"not a zip file")
+    resp = upload(client, filepath, sha256(filepath), **{"async": "1"})
+    assert resp.status_code == 202
+    job = resp.get_json()
+    assert resp.headers["Location"].endswith(f"/upload/{job['job']}")
+    assert job["status"] in UploadJob.PENDING
+
+    data = wait_for_job(client, job["job"])
+    assert data["status"] == "failed"
+    assert data["code"] == 406
+
+
+def test_async_upload_done(client, user, mobility):
+    filepath, sha256 = mobility
+    resp = upload(client, filepath, sha256, **{"async": "1"})
+    assert resp.status_code == 202
+
+    data = wait_for_job(client, resp.get_json()["job"])
+    assert data["status"] == "done"
+    assert data["code"] == 200
+    assert data["result"]["sha256"] == sha256
+    assert File.get(File.sha256 == sha256).database == "Mobility example"
+    assert not list(jobs.staging_dir.glob("*.zip"))
+
+
+def test_unknown_job(client):
+    assert client.get("/upload/missing").status_code == 404
+
+
+def test_expire_stopped_worker(client, user, tmp_path):
+    staged = tmp_path / "staged.zip"
+    staged.write_bytes(b"data")
+    job = UploadJob.create(
+        user=user,
+        sha256="a" * 64,
+        filename="x.zip",
+        database="x",
+        path=str(staged),
+        worker="stopped",
+    )
+    data = client.get(f"/upload/{job.id}").get_json()
+    assert data["status"] == "failed"
+    assert "server restart" in data["message"]
+    assert not staged.exists()
+
+
+def test_expire_running_job_keeps_status_and_file(app, user, mobility, monkeypatch):
+    filepath, sha256 = mobility
+    seen = {}
+
+    def slow_store_package(*args):
+        # The job times out while it's being stored
+        jobs.upload_queue.expire(timeout=-1)
+        seen["staged"] = filepath.exists()
+        return {"sha256": sha256}
+
+    monkeypatch.setattr(jobs, "store_package", slow_store_package)
+    with app.test_request_context():
+        job = jobs.upload_queue.submit(
+            user=user,
+            path=filepath,
+            sha256=sha256,
+            filename="mobility.zip",
+            database="Mobility example",
+        )
+    deadline = time.monotonic() + 30
+    while UploadJob.get_by_id(job.id).finished is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    job = UploadJob.get_by_id(job.id)
+    assert seen["staged"]
+    assert job.status == "failed"
+    assert "in time" in job.message
+    assert not filepath.exists()
+
+
+def test_expire_old_jobs(app, user):
+    job = UploadJob.create(
+        user=user,
+        sha256="b" * 64,
+        filename="x.zip",
+        database="x",
+        worker=jobs.upload_queue.worker,
+        created=datetime.datetime.now() - datetime.timedelta(hours=2),
+    )
+    jobs.upload_queue.expire(app.config["UPLOAD_JOB_TIMEOUT"])
+    assert UploadJob.get_by_id(job.id).status == "failed"
+
+
+def test_forked_worker_gets_own_id(app, user, mobility, monkeypatch):
+    filepath, sha256 = mobility
+    queue = jobs.upload_queue
+    queue._get_executor(app)
+    parent = queue.worker
+
+    monkeypatch.setattr(jobs.os, "getpid", lambda: -1)
+    queue._get_executor(app)
+    assert queue.worker != parent
+    assert jobs.worker_alive(queue.worker)
+    assert not jobs.worker_alive(parent)
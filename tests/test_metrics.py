@@ -0,0 +1,152 @@
+import json
+import logging
+import sys
+
+from conftest import upload
+
+from dardanelles.server.filesystem import logs_dir
+from dardanelles.server.metrics import (
+    Counter,
+    Histogram,
+    JSONFormatter,
+    configure_logging,
+    format_labels,
+    logger,
+)
+
+PHASES = ("save", "hash", "dedupe", "parse", "store", "insert")
+
+
+def sample(client, name, **labels):
+    """Value of the sample `name` with `labels` from `/metrics`, or 0 if missing"""
+    resp = client.get("/metrics")
+    assert resp.mimetype == "text/plain"
+    prefix = name + format_labels(labels) + " "
+    for line in resp.get_data(as_text=True).splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix) :])
+    return 0
+
+
+def test_metric_rendering():
+    counter = Counter("test_total", "Things", labels=("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind='quote"d')
+    counter.add_callback(lambda: {("a",): 3})
+    assert counter.render().splitlines() == [
+        "# HELP test_total Things",
+        "# TYPE test_total counter",
+        'test_total{kind="a"} 4',
+        'test_total{kind="quote\\"d"} 2',
+    ]
+
+    histogram = Histogram("test_seconds", "Time", buckets=(1, 5))
+    for value in (0.5, 2, 10):
+        histogram.observe(value)
+    assert histogram.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="1"} 1',
+        'test_seconds_bucket{le="5"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        "test_seconds_sum 12.5",
+        "test_seconds_count 3",
+    ]
+
+
+def test_request_metrics(client):
+    labels = {"endpoint": "ping", "method": "GET"}
+    requests = sample(client, "dardanelles_requests_total", **labels, status=200)
+    observed = sample(client, "dardanelles_request_duration_seconds_count", **labels)
+    missing = sample(
+        client, "dardanelles_requests_total", endpoint="none", method="GET", status=404
+    )
+
+    client.get("/ping")
+    client.get("/ping")
+    client.get("/no/such/page")
+
+    assert (
+        sample(client, "dardanelles_requests_total", **labels, status=200)
+        == requests + 2
+    )
+    assert (
+        sample(client, "dardanelles_request_duration_seconds_count", **labels)
+        == observed + 2
+    )
+    assert (
+        sample(
+            client,
+            "dardanelles_requests_total",
+            endpoint="none",
+            method="GET",
+            status=404,
+        )
+        == missing + 1
+    )
+
+
+def test_cache_metrics(client):
+    hits = sample(
+        client, "dardanelles_cache_requests_total", cache="index", result="hit"
+    )
+    misses = sample(
+        client, "dardanelles_cache_requests_total", cache="index", result="miss"
+    )
+    client.get("/")
+    client.get("/")
+    assert (
+        sample(client, "dardanelles_cache_requests_total", cache="index", result="miss")
+        == misses + 1
+    )
+    assert (
+        sample(client, "dardanelles_cache_requests_total", cache="index", result="hit")
+        == hits + 1
+    )
+
+
+def test_upload_phase_metrics(client, user, mobility):
+    before = {
+        phase: sample(client, "dardanelles_upload_phase_seconds_count", phase=phase)
+        for phase in PHASES
+    }
+    filepath, sha256 = mobility
+    assert upload(client, filepath, sha256).status_code == 200
+    for phase in PHASES:
+        assert (
+            sample(client, "dardanelles_upload_phase_seconds_count", phase=phase)
+            == before[phase] + 1
+        )
+
+
+def test_json_formatter():
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = logging.LogRecord(
+            "dardanelles.server", logging.ERROR, __file__, 1, "failed", (), None
+        )
+        record.exc_info = sys.exc_info()
+    record.fields = {"job": "abc"}
+    data = json.loads(JSONFormatter().format(record))
+    assert data["level"] == "error"
+    assert data["event"] == "failed"
+    assert data["job"] == "abc"
+    assert "ValueError: broken" in data["exception"]
+
+
+def test_request_log(client, tmp_path):
+    filepath = tmp_path / "server.log"
+    configure_logging(filepath)
+    try:
+        client.get("/ping")
+        (line,) = filepath.read_text().splitlines()
+        data = json.loads(line)
+        assert data["event"] == "request"
+        assert data["endpoint"] == "ping"
+        assert data["status"] == 200
+
+        configure_logging(None)
+        assert logger.disabled
+        client.get("/ping")
+        assert len(filepath.read_text().splitlines()) == 1
+    finally:
+        configure_logging(logs_dir / "server.log")
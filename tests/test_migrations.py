@@ -0,0 +1,102 @@
+import json
+import shutil
+
+import pytest
+from conftest import make_package
+
+from dardanelles.server.db import Dependency, File, db_filepath, sql_database
+from dardanelles.server.migrations import MIGRATIONS, migrate_database, schema_version
+from dardanelles.server.search import search_files
+from dardanelles.server.store import blob_path
+
+# Schema before any migrations, as created by the first release
+BASELINE = [
+    'CREATE TABLE "user" ("id" INTEGER NOT NULL PRIMARY KEY, "name" TEXT NOT NULL, '
+    '"api_key" TEXT NOT NULL, "email_hash" TEXT NOT NULL)',
+    'CREATE UNIQUE INDEX "user_name" ON "user" ("name")',
+    'CREATE UNIQUE INDEX "user_api_key" ON "user" ("api_key")',
+    'CREATE UNIQUE INDEX "user_email_hash" ON "user" ("email_hash")',
+    'CREATE TABLE "file" ("id" INTEGER NOT NULL PRIMARY KEY, "user_id" INTEGER NOT NULL, '
+    '"filepath" TEXT NOT NULL, "sha256" TEXT NOT NULL, "database" TEXT NOT NULL, '
+    '"description" TEXT NOT NULL, "depends" TEXT NOT NULL, "created" DATETIME NOT NULL, '
+    '"accessed" DATETIME NOT NULL, "count" INTEGER NOT NULL, '
+    'FOREIGN KEY ("user_id") REFERENCES "user" ("id"))',
+    'CREATE INDEX "file_user_id" ON "file" ("user_id")',
+    'CREATE UNIQUE INDEX "file_sha256" ON "file" ("sha256")',
+]
+
+
+@pytest.fixture
+def baseline_database(app, tmp_path):
+    """Point the server at a database with the baseline schema, and back afterwards"""
+    sql_database.close()
+    sql_database.init(str(tmp_path / "baseline.db"))
+    for statement in BASELINE:
+        sql_database.execute_sql(statement)
+    yield sql_database
+    sql_database.close()
+    sql_database.init(db_filepath)
+
+
+def test_migrate_baseline(baseline_database, tmp_path):
+    # Uploads used to be kept with their original filename
+    legacy, sha256 = make_package(tmp_path, depends=["biosphere"])
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    filepath = uploads / "mobility.zip"
+    shutil.move(legacy, filepath)
+
+    sql_database.execute_sql(
+        'INSERT INTO "user" VALUES (1, ?, ?, ?)', ("alice", "alice-key", "hash")
+    )
+    sql_database.execute_sql(
+        'INSERT INTO "file" VALUES (1, 1, ?, ?, ?, ?, ?, ?, ?, 0)',
+        (
+            str(filepath),
+            sha256,
+            "Mobility example",
+            "Old upload",
+            json.dumps(["biosphere"], indent=2),
+            "2020-01-01 00:00:00",
+            "2020-01-01 00:00:00",
+        ),
+    )
+
+    migrate_database()
+    assert schema_version() == len(MIGRATIONS)
+    assert sql_database.pragma("journal_mode") == "wal"
+
+    columns = {column.name for column in sql_database.get_columns("file")}
+    assert {"filename", "base"} <= columns
+    columns = {column.name for column in sql_database.get_columns("uploadjob")}
+    assert {"path", "worker"} <= columns
+    assert "file_created" in {index.name for index in sql_database.get_indexes("file")}
+
+    obj = File.get(File.sha256 == sha256)
+    assert obj.filename == "mobility.zip"
+    assert obj.filepath == str(blob_path(sha256))
+    assert blob_path(sha256).read_bytes() == filepath.read_bytes()
+    assert [dep.database for dep in obj.dependencies] == ["biosphere"]
+    (depends,) = sql_database.execute_sql(
+        "SELECT depends FROM file WHERE id = 1"
+    ).fetchone()
+    assert depends == '["biosphere"]'
+    files, total = search_files("mobility")
+    assert total == 1 and files[0]["sha256"] == sha256
+
+    # Migrations are only applied once
+    migrate_database()
+    assert Dependency.select().count() == 1
+    assert schema_version() == len(MIGRATIONS)
+
+
+def test_new_database_is_current(app, tmp_path):
+    sql_database.close()
+    sql_database.init(str(tmp_path / "new.db"))
+    try:
+        migrate_database()
+        assert schema_version() == len(MIGRATIONS)
+        assert File.select().count() == 0
+    finally:
+        sql_database.close()
+        sql_database.init(db_filepath)
@@ -0,0 +1,33 @@
+from conftest import make_package, upload
+
+from dardanelles.datapackage import Datapackage
+from dardanelles.server.search import search_document
+
+
+def test_search_document_reads_chunks(mobility):
+    filepath, _ = mobility
+    dp = Datapackage(filepath, lazy=True)
+    document = search_document(dp, chunk_size=2)
+
+    # Only the indexed columns were read, not the whole nodes table
+    assert not dp._data
+    values = document["nodes"].split("\n")
+    assert "Electric car" in values
+    assert "GLO" in values
+    assert len(values) == len(set(values))
+    assert search_document(dp, chunk_size=1000)["nodes"].split("\n") == values
+
+
+def test_search(client, user, tmp_path):
+    filepath, sha256 = make_package(tmp_path, description="Cars and batteries")
+    assert upload(client, filepath, sha256).status_code == 200
+
+    for q in ("batteries", "electric", "nodes:GLO", '"electric car"'):
+        resp = client.get("/search", query_string={"q": q})
+        assert resp.status_code == 200
+        assert [row["sha256"] for row in resp.get_json()] == [sha256]
+        assert resp.headers["X-Total-Count"] == "1"
+
+    assert client.get("/search?q=zeppelin").get_json() == []
+    assert client.get("/search").status_code == 400
+    assert client.get("/search", query_string={"q": '"unbalanced'}).status_code == 400
@@ -0,0 +1,152 @@
+import threading
+
+from conftest import make_package
+
+from dardanelles.client.utils import sha256
+
+from dardanelles.server import sessions
+from dardanelles.server.db import File, UploadSession, User
+
+
+def start_session(client, sha256, size, chunk_size=1000):
+    client.application.config["UPLOAD_CHUNK_SIZE"] = chunk_size
+    resp = client.post(
+        "/upload/session",
+        data={
+            "sha256": sha256,
+            "size": size,
+            "database": "Mobility example",
+            "filename": "mobility.zip",
+            "api_key": "alice-key",
+        },
+    )
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def send_chunks(client, session, data, api_key="alice-key"):
+    size = session["chunk_size"]
+    for i in range(0, len(data), size):
+        resp = client.put(
+            f"/upload/session/{session['session']}/{i // size}",
+            query_string={"api_key": api_key},
+            data=data[i : i + size],
+        )
+        assert resp.status_code == 200
+
+
+def finish(client, session, **fields):
+    return client.post(
+        f"/upload/session/{session['session']}/finish",
+        data={"api_key": "alice-key", **fields},
+    )
+
+
+def test_chunked_upload(client, user, mobility):
+    filepath, sha256 = mobility
+    data = filepath.read_bytes()
+    session = start_session(client, sha256, len(data))
+    assert session["received"] == []
+
+    send_chunks(client, session, data)
+    status = client.get(
+        f"/upload/session/{session['session']}", query_string={"api_key": "alice-key"}
+    ).get_json()
+    assert status["received"] == list(range(-(-len(data) // 1000)))
+
+    resp = finish(client, session)
+    assert resp.status_code == 200
+    assert resp.get_json()["sha256"] == sha256
+    assert File.get(File.sha256 == sha256)
+    assert not UploadSession.select().exists()
+    assert finish(client, session).status_code == 404
+
+
+def test_session_resumes(client, user, mobility):
+    filepath, sha256 = mobility
+    data = filepath.read_bytes()
+    session = start_session(client, sha256, len(data))
+    send_chunks(client, session, data[:1000])
+
+    resumed = start_session(client, sha256, len(data))
+    assert resumed["session"] == session["session"]
+    assert resumed["received"] == [0]
+    assert finish(client, session).status_code == 400
+
+
+def test_session_checks_user_and_chunks(client, user, mobility):
+    User.create(name="eve", api_key="eve-key", email_hash="eve")
+    filepath, sha256 = mobility
+    session = start_session(client, sha256, filepath.stat().st_size)
+    url = f"/upload/session/{session['session']}"
+
+    assert client.put(f"{url}/0", data=b"x").status_code == 400
+    assert client.put(f"{url}/0?api_key=eve-key", data=b"x").status_code == 406
+    assert client.put(f"{url}/0?api_key=wrong", data=b"x").status_code == 406
+    assert client.put(f"{url}/0?api_key=alice-key", data=b"x").status_code == 400
+    assert client.put(f"{url}/999?api_key=alice-key", data=b"x").status_code == 404
+    assert client.get(f"{url}?api_key=eve-key").status_code == 406
+    assert client.post(f"{url}/finish", data={"api_key": "eve-key"}).status_code == 406
+    assert client.get("/upload/session/missing?api_key=alice-key").status_code == 404
+
+
+def test_wrong_hash_can_be_retried(client, user, mobility):
+    filepath, sha256 = mobility
+    data = filepath.read_bytes()
+    session = start_session(client, sha256, len(data))
+    corrupt = bytes([data[0] ^ 1]) + data[1:]
+    send_chunks(client, session, corrupt)
+
+    assert finish(client, session).status_code == 406
+    # Only the corrupt chunk needs to be sent again
+    status = client.get(
+        f"/upload/session/{session['session']}", query_string={"api_key": "alice-key"}
+    ).get_json()
+    assert len(status["received"]) == -(-len(data) // 1000)
+    send_chunks(client, session, data[:1000])
+    assert finish(client, session).status_code == 200
+
+
+def test_invalid_package_removes_session(client, user, tmp_path):
+    filepath = tmp_path / "invalid.zip"
+    filepath.write_bytes(b"not a datapackage" * 100)
+    session = start_session(client, sha256(filepath), filepath.stat().st_size)
+    send_chunks(client, session, filepath.read_bytes())
+    assert finish(client, session).status_code == 406
+    assert not UploadSession.select().exists()
+
+
+def test_concurrent_finish(app, user, mobility, monkeypatch):
+    filepath, sha256 = mobility
+    client = app.test_client()
+    data = filepath.read_bytes()
+    session = start_session(client, sha256, len(data))
+    send_chunks(client, session, data)
+
+    # Hold the first request after it claimed the chunks
+    claimed, proceed = threading.Event(), threading.Event()
+    assemble = sessions.assemble
+
+    def slow_assemble(*args):
+        claimed.set()
+        proceed.wait(10)
+        return assemble(*args)
+
+    monkeypatch.setattr("dardanelles.server.app.assemble", slow_assemble)
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(finish(app.test_client(), session).status_code)
+    )
+    thread.start()
+    assert claimed.wait(10)
+    assert finish(client, session).status_code == 409
+    proceed.set()
+    thread.join()
+    assert results == [200]
+
+
+def test_large_package_upload_with_client(remote, tmp_path):
+    filepath, sha256 = make_package(tmp_path, "large.zip", description="x" * 5000)
+    remote.chunked_upload_threshold = 1000
+    result = remote._upload(filepath, "Mobility example", poll_interval=0.05)
+    assert result["sha256"] == sha256
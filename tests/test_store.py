@@ -0,0 +1,64 @@
+import pytest
+from conftest import upload
+
+from dardanelles.server.db import File
+from dardanelles.server.store import (
+    add_blob,
+    add_sidecar,
+    blob_path,
+    remove_blob,
+    sidecar_path,
+    uploads_dir,
+    valid_hash,
+)
+
+HASH = "ab" + "c" * 62
+
+
+def test_blob_path_is_sharded(app):
+    assert blob_path(HASH) == uploads_dir / "ab" / "cc" / f"{HASH}.zip"
+    assert sidecar_path(HASH, "summary").name == f"{HASH}.summary.json"
+    assert valid_hash(HASH)
+    for value in ("", "ABC" + "c" * 61, "../" + "c" * 61, HASH + "0"):
+        assert not valid_hash(value)
+        with pytest.raises(ValueError):
+            blob_path(value)
+
+
+def test_add_blob_moves(app, tmp_path):
+    filepath = tmp_path / "package.zip"
+    filepath.write_bytes(b"data")
+    assert add_blob(filepath, HASH) == blob_path(HASH)
+    assert blob_path(HASH).read_bytes() == b"data"
+    assert not filepath.exists()
+
+    # An existing blob is kept
+    filepath.write_bytes(b"other")
+    add_blob(filepath, HASH)
+    assert blob_path(HASH).read_bytes() == b"data"
+    assert not filepath.exists()
+
+
+def test_add_blob_links(app, tmp_path):
+    filepath = tmp_path / "package.zip"
+    filepath.write_bytes(b"data")
+    add_blob(filepath, HASH, link=True)
+    assert filepath.exists()
+    assert blob_path(HASH).read_bytes() == b"data"
+
+
+def test_remove_blob(app, tmp_path):
+    filepath = tmp_path / "package.zip"
+    filepath.write_bytes(b"data")
+    add_blob(filepath, HASH)
+    add_sidecar(HASH, "summary", {})
+    remove_blob(HASH)
+    assert not list(blob_path(HASH).parent.iterdir())
+
+
+def test_uploads_are_stored_by_hash(client, user, mobility):
+    filepath, sha256 = mobility
+    assert upload(client, filepath, sha256).status_code == 200
+    obj = File.get(File.sha256 == sha256)
+    assert obj.filepath == str(blob_path(sha256))
+    assert blob_path(sha256).read_bytes() == filepath.read_bytes()
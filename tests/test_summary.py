@@ -0,0 +1,87 @@
+import json
+
+import pytest
+from conftest import upload
+
+from dardanelles.datapackage import Datapackage
+from dardanelles.server.store import sidecar_path
+from dardanelles.server.summary import build_summary, load_summary, node_listing
+
+
+def test_summary_and_listing_read_chunks(mobility):
+    filepath, _ = mobility
+    dp = Datapackage(filepath, lazy=True)
+    summary = build_summary(dp, dp.validate(), chunk_size=2)
+    nodes = list(node_listing(dp, chunk_size=2))
+
+    assert not dp._data
+    assert summary["source_databases"] == ["Mobility example"]
+    assert len(nodes) == summary["nodes"] == 9
+    assert nodes[0] == {
+        "id": 9,
+        "database": "Mobility example",
+        "code": "CO2",
+        "name": "CO2",
+        "type": "emission",
+        "unit": "kilogram",
+    }
+
+
+def test_package_summary(client, user, mobility):
+    filepath, sha256 = mobility
+    assert upload(client, filepath, sha256).status_code == 200
+
+    resp = client.get(f"/package/{sha256}/summary")
+    assert resp.status_code == 200
+    summary = resp.get_json()
+    assert summary["database"] == "Mobility example"
+    assert (summary["nodes"], summary["edges"]) == (9, 20)
+    assert (
+        client.get(
+            f"/package/{sha256}/summary",
+            headers={"If-None-Match": resp.headers["ETag"]},
+        ).status_code
+        == 304
+    )
+
+    assert client.get(f"/package/{'0' * 64}/summary").status_code == 404
+    assert client.get("/package/invalid/summary").status_code == 404
+
+
+def test_package_nodes_pages(client, user, mobility):
+    filepath, sha256 = mobility
+    assert upload(client, filepath, sha256).status_code == 200
+
+    everything = client.get(f"/package/{sha256}/nodes").get_json()
+    assert len(everything) == 9
+    resp = client.get(f"/package/{sha256}/nodes?limit=3&offset=2")
+    assert resp.get_json() == everything[2:5]
+    assert resp.headers["X-Total-Count"] == "9"
+    assert client.get(f"/package/{sha256}/nodes?offset=20").get_json() == []
+
+
+def test_sidecars_computed_for_old_packages(client, user, mobility):
+    filepath, sha256 = mobility
+    assert upload(client, filepath, sha256).status_code == 200
+    sidecar_path(sha256, "summary").unlink()
+    sidecar_path(sha256, "nodes", "jsonl").unlink()
+    load_summary.cache_clear()
+
+    assert client.get(f"/package/{sha256}/summary").get_json()["nodes"] == 9
+    assert len(client.get(f"/package/{sha256}/nodes").get_json()) == 9
+
+
+def test_corrupt_sidecar_isnt_hidden(app, user, mobility):
+    filepath, sha256 = mobility
+    client = app.test_client()
+    assert upload(client, filepath, sha256).status_code == 200
+    sidecar_path(sha256, "summary").write_text("{")
+    load_summary.cache_clear()
+
+    with pytest.raises(json.JSONDecodeError):
+        load_summary(sha256)
+    app.config["PROPAGATE_EXCEPTIONS"] = False
+    try:
+        assert client.get(f"/package/{sha256}/summary").status_code == 500
+    finally:
+        app.config["PROPAGATE_EXCEPTIONS"] = None
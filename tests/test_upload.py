@@ -0,0 +1,85 @@
+import hashlib
+
+import pytest
+from conftest import upload
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from dardanelles.server.db import File
+from dardanelles.server.filesystem import staging_dir
+from dardanelles.server.uploads import HashingFile
+
+
+def staged_files():
+    return [path for path in staging_dir.iterdir() if path.suffix != ".lock"]
+
+
+def test_hashing_file(tmp_path):
+    staged = HashingFile(dirpath=tmp_path)
+    for chunk in (b"abc", b"def"):
+        staged.write(chunk)
+    staged.close()
+    assert staged.hexdigest() == hashlib.sha256(b"abcdef").hexdigest()
+    assert staged.size == 6
+    assert staged.path.read_bytes() == b"abcdef"
+    staged.discard()
+    assert not staged.path.exists()
+
+
+def test_hashing_file_max_size(tmp_path):
+    staged = HashingFile(dirpath=tmp_path, max_size=4)
+    staged.write(b"abc")
+    with pytest.raises(RequestEntityTooLarge):
+        staged.write(b"de")
+    staged.discard()
+
+
+def test_upload(client, user, mobility):
+    filepath, sha256 = mobility
+    resp = upload(client, filepath, sha256)
+    assert resp.status_code == 200
+    assert resp.get_json() == {"filename": f"{sha256}.zip", "sha256": sha256}
+    obj = File.get(File.sha256 == sha256)
+    assert (obj.user.name, obj.database, obj.filename) == (
+        "alice",
+        "Mobility example",
+        "mobility.zip",
+    )
+    assert not staged_files()
+
+
+def test_upload_rejected(client, user, mobility):
+    filepath, sha256 = mobility
+    assert upload(client, filepath, "0" * 64).status_code == 406
+    assert upload(client, filepath, sha256, api_key="wrong").status_code == 406
+    assert not staged_files()
+
+    assert upload(client, filepath, sha256).status_code == 200
+    assert upload(client, filepath, sha256).status_code == 409
+    assert not staged_files()
+    assert File.select().count() == 1
+
+
+def test_upload_too_large(client, app, user, mobility):
+    filepath, sha256 = mobility
+    app.config["MAX_PACKAGE_SIZE"] = 100
+    try:
+        # Rejected by the declared length, before the body is read
+        assert upload(client, filepath, sha256).status_code == 413
+        assert not staged_files()
+    finally:
+        app.config["MAX_PACKAGE_SIZE"] = 128 * 1024 * 1024
+
+
+def test_upload_must_be_multipart(client, user, mobility):
+    filepath, sha256 = mobility
+    resp = client.post(
+        "/upload",
+        data={
+            "sha256": sha256,
+            "database": "Mobility example",
+            "filename": "mobility.zip",
+            "api_key": "alice-key",
+        },
+    )
+    assert resp.status_code == 400